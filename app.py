@@ -10,16 +10,22 @@ import schedule
 import time
 from datetime import datetime, timedelta
 from collections import defaultdict
+from typing import Optional
 from logging.handlers import RotatingFileHandler
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit, join_room
 from werkzeug.utils import secure_filename
 from flask_wtf.csrf import CSRFProtect
 from config import Config
-from database import db
+from database import db, build_message_preview, encode_cursor, decode_cursor, UNREADABLE_PREVIEW, MessageRecord, MESSAGE_SELECT, VISIBLE_EPOCH, LIVE_THREAD
+from migrations import run_migrations
 from rate_limiter import rate_limit
-from cache import message_cache, cached_thread_messages
+from cache import message_cache, cached_thread_messages, read_flight, thread_list_cache, thread_messages_key
 from security import security_manager
+from presence import presence
+from invalidation import create_invalidation_bus
+from offload import blocking_executor
 
 # Enhanced Logging Setup - Railway için JSON format + Log Injection Protection
 def setup_enhanced_logging():
@@ -72,7 +78,18 @@ def setup_enhanced_logging():
 # Initialize enhanced logging
 logger = setup_enhanced_logging()
 
+class AppJSONProvider(DefaultJSONProvider):
+    """MessageRecord'lar yalnızca JSON'a yazılırken dict'e çevrilir"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, MessageRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json_provider_class = AppJSONProvider
+app.json = AppJSONProvider(app)
 app.config['SECRET_KEY'] = Config.SECRET_KEY
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
@@ -115,6 +132,10 @@ if Config.TELEGRAM_BOT_TOKEN:
     telegram_bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
     telegram_app = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
     
+    # İşlenmekte olan (dedup satırı henüz commit edilmemiş) Telegram mesajları
+    telegram_inbound_claims = set()
+    telegram_inbound_lock = threading.Lock()
+
     # Telegram message handler with improved thread matching and media support
     async def handle_telegram_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
          if not update.message:
@@ -156,93 +177,85 @@ if Config.TELEGRAM_BOT_TOKEN:
              # Unsupported message type
              return
 
-         # Dedup: Bu Telegram mesajı daha önce işlendi mi?
-         already = db.execute_query(
-             'SELECT id FROM telegram_inbound WHERE tg_chat_id = ? AND tg_message_id = ?',
-             (chat_id, incoming_id),
-             fetch='one'
-         )
-         if already:
-             logging.info(f"Telegram inbound duplicate skip: chat_id={chat_id}, msg_id={incoming_id}")
-             return
-
-         # Check if it's a reply to a previous message
-         thread_id = None
-         if update.message.reply_to_message:
-             # Reply mesajı ise, orijinal mesajın thread_id'sini bul
-             reply_to_id = update.message.reply_to_message.message_id
-             link = db.execute_query(
-                 'SELECT thread_id FROM telegram_links WHERE tg_message_id = ?',
-                 (reply_to_id,),
+         # Yazma kuyruğundaki (henüz commit edilmemiş) teslimatlar DB'de görünmez;
+         # aynı mesajın tekrar teslimi claim ile atlanır
+         inbound_key = (chat_id, incoming_id)
+         with telegram_inbound_lock:
+             if inbound_key in telegram_inbound_claims:
+                 logging.info(f"Telegram inbound duplicate skip (pending): chat_id={chat_id}, msg_id={incoming_id}")
+                 return
+             telegram_inbound_claims.add(inbound_key)
+         try:
+             # Dedup: Bu Telegram mesajı daha önce işlendi mi?
+             already = db.execute_query(
+                 'SELECT id FROM telegram_inbound WHERE tg_chat_id = ? AND tg_message_id = ?',
+                 (chat_id, incoming_id),
                  fetch='one'
              )
-             if link:
-                 thread_id = link['thread_id']
-                 logger.info(f"Reply detected, using thread_id: {thread_id}")
-
-         # If no thread_id from reply, check for #thread: tag in message
-         if not thread_id:
-             thread_match = re.search(r'#thread:([a-f0-9\-]+)', content_text)
-             if thread_match:
-                 potential_thread_id = thread_match.group(1)
-                 # Validate thread exists
-                 thread_check = db.execute_query(
-                     'SELECT id FROM threads WHERE id = ?',
-                     (potential_thread_id,),
+             if already:
+                 logging.info(f"Telegram inbound duplicate skip: chat_id={chat_id}, msg_id={incoming_id}")
+                 return
+
+             # Check if it's a reply to a previous message
+             thread_id = None
+             if update.message.reply_to_message:
+                 # Reply mesajı ise, orijinal mesajın thread_id'sini bul
+                 reply_to_id = update.message.reply_to_message.message_id
+                 link = db.execute_query(
+                     'SELECT thread_id FROM telegram_links WHERE tg_message_id = ?',
+                     (reply_to_id,),
                      fetch='one'
                  )
-                 if thread_check:
-                     thread_id = potential_thread_id
-                     logger.info(f"Thread tag found, using thread_id: {thread_id}")
-
-         # If still no thread_id, this is a new message - create new thread
-         if not thread_id:
-             thread_id = str(uuid.uuid4())
-             display_name = f"Telegram-{chat_id}"
-             db.execute_query(
-                 'INSERT INTO threads (id, display_name) VALUES (?, ?)',
-                 (thread_id, display_name),
-                 fetch=None
-             )
-             logger.info(f"New thread created for Telegram message: {thread_id}")
-
-         # Save inbound message to prevent duplicates
-         db.execute_query(
-             'INSERT INTO telegram_inbound (tg_chat_id, tg_message_id) VALUES (?, ?)',
-             (chat_id, incoming_id),
-             fetch=None
-         )
-
-         # Save message to database (encrypt text content)
-         msg_id = str(uuid.uuid4())
-         encrypted_content = encrypt_message(content_text, ENCRYPTION_KEY) if content_text and media_type == 'text' else content_text
-         db.execute_query(
-             'INSERT INTO messages (id, thread_id, sender, type, content_text, file_path) VALUES (?, ?, ?, ?, ?, ?)',
-             (msg_id, thread_id, 'telegram', media_type, encrypted_content, file_path),
-             fetch=None
-         )
-
-         # Link Telegram message to thread for future replies
-         db.execute_query(
-             'INSERT INTO telegram_links (thread_id, tg_chat_id, tg_message_id) VALUES (?, ?, ?)',
-             (thread_id, chat_id, incoming_id),
-             fetch=None
-         )
-
-         # Emit to admin room and visitor room
-         msg = db.execute_query('SELECT * FROM messages WHERE id = ?', (msg_id,), fetch='one')
-         if msg and msg['content_text'] and msg['type'] == 'text':
-             try:
-                 msg['content_text'] = decrypt_message(msg['content_text'], ENCRYPTION_KEY)
-             except Exception as e:
-                 logger.warning(f"Failed to decrypt telegram message {msg_id}: {e}")
-
-         # Send to admin room
-         socketio.emit('message_from_telegram', msg, room='admin_room')
-         # Send to visitor room (thread room) - Telegram mesajları için doğru event
-         socketio.emit('message_from_telegram', msg, room=thread_id)
-
-         logger.info(f"Telegram message processed: thread={thread_id}, msg_id={msg_id}, type={media_type}")
+                 if link:
+                     thread_id = link['thread_id']
+                     logger.info(f"Reply detected, using thread_id: {thread_id}")
+
+             # If no thread_id from reply, check for #thread: tag in message
+             if not thread_id:
+                 thread_match = re.search(r'#thread:([a-f0-9\-]+)', content_text)
+                 if thread_match:
+                     potential_thread_id = thread_match.group(1)
+                     # Validate thread exists
+                     thread_check = db.execute_query(
+                         f'SELECT id FROM threads WHERE id = ? AND {LIVE_THREAD}',
+                         (potential_thread_id,),
+                         fetch='one'
+                     )
+                     if thread_check:
+                         thread_id = potential_thread_id
+                         logger.info(f"Thread tag found, using thread_id: {thread_id}")
+
+             # If still no thread_id, this is a new message - create new thread
+             if not thread_id:
+                 thread_id = str(uuid.uuid4())
+                 display_name = f"Telegram-{chat_id}"
+                 db.create_thread(thread_id, display_name)
+                 logger.info(f"New thread created for Telegram message: {thread_id}")
+
+             # Save inbound message to prevent duplicates (mesajla aynı flush'ta yazılır)
+             inbound = db.writer.submit('telegram_inbound', (chat_id, incoming_id))
+
+             # Save message to database (encrypt text content) - düz metin DTO döner
+             msg = db.insert_message(thread_id, 'telegram', media_type, content_text, file_path, encrypt=encrypt_for_storage)
+             msg_id = msg['id']
+
+             # Link Telegram message to thread for future replies
+             db.writer.submit('telegram_links', (thread_id, chat_id, incoming_id))
+             # Claim, dedup satırı commit edilene kadar tutulur
+             inbound.wait(Config.WRITE_BEHIND_WAIT_TIMEOUT)
+
+             # Emit to admin room and visitor room
+             # Send to admin room
+             socketio.emit('message_from_telegram', msg, room='admin_room')
+             # Send to visitor room (thread room) - Telegram mesajları için doğru event
+             socketio.emit('message_from_telegram', msg, room=thread_id)
+
+             message_cache.append_thread_message(thread_id, msg)
+
+             logger.info(f"Telegram message processed: thread={thread_id}, msg_id={msg_id}, type={media_type}")
+         finally:
+             with telegram_inbound_lock:
+                 telegram_inbound_claims.discard(inbound_key)
     
     # Add handlers for different message types
     telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_telegram_message))
@@ -260,11 +273,7 @@ if Config.TELEGRAM_BOT_TOKEN:
                 tg_msg = await telegram_bot.send_message(chat_id=chat_id, text=text)
                 if thread_id:
                     try:
-                        db.execute_query(
-                            'INSERT INTO telegram_links (thread_id, tg_chat_id, tg_message_id) VALUES (?, ?, ?)',
-                            (thread_id, str(tg_msg.chat_id), tg_msg.message_id),
-                            fetch=None
-                        )
+                        db.writer.submit('telegram_links', (thread_id, str(tg_msg.chat_id), tg_msg.message_id))
                     except Exception as e:
                         logger.warning(f"telegram_links insert failed: {e}")
                 logger.info(f"Telegram gönderimi başarılı: chat={tg_msg.chat_id}, msg_id={tg_msg.message_id}, attempt={attempt+1}")
@@ -335,38 +344,36 @@ if Config.is_production() and Config.CLOUDINARY_CLOUD_NAME:
         pass
 
 # Encryption utilities
-import base64
 import hashlib
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-
-# Generate encryption key from password
-def get_encryption_key(password: str, salt: bytes = None) -> bytes:
-    if salt is None:
-        salt = os.urandom(16)
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-    return key
-
-# Encrypt/decrypt functions
-def encrypt_message(text: str, key: bytes) -> str:
-    f = Fernet(key)
-    encrypted = f.encrypt(text.encode())
-    return base64.urlsafe_b64encode(encrypted).decode()
-
-def decrypt_message(encrypted_text: str, key: bytes) -> str:
-    f = Fernet(key)
-    decrypted = f.decrypt(base64.urlsafe_b64decode(encrypted_text))
-    return decrypted.decode()
-
-# Global encryption key (should be from config in production)
-ENCRYPTION_KEY = get_encryption_key(Config.SECRET_KEY)
+from crypto import crypto
+
+def encrypt_for_storage(text: str, thread_id: Optional[str] = None):
+    """db.insert_message için (token, key epoch) (thread verilirse thread'in veri anahtarıyla)"""
+    return crypto.encrypt_with_epoch(text, thread_id)
+
+def decrypt_from_storage(text: str, thread_id: Optional[str] = None) -> str:
+    """DB'deki şifreli metni key ring (veya thread anahtarı) ile çöz"""
+    return crypto.decrypt(text, thread_id)
+
+# Şema migration'ları process başlangıcında bir kez uygulanır (deploy'da
+# scripts/migrate.py de çalışır); request yolunda şema kontrolü yapılmaz
+try:
+    applied_migrations = run_migrations(db, decrypt=decrypt_from_storage)
+    if applied_migrations:
+        logger.info(f"Database migrations applied: {', '.join(applied_migrations)}")
+except Exception as e:
+    logger.error(f'Database migration failed: {e}')
+
+# Worker başına tutulan cache'lerin invalidation'ları diğer worker'lara yayılır
+invalidation_bus = create_invalidation_bus(db)
+if message_cache.backend_name == 'memory':
+    message_cache.attach_bus(invalidation_bus, 'messages')
+thread_list_cache.attach_bus(invalidation_bus, 'threads')
+crypto.attach_bus(invalidation_bus)
+presence.attach_bus(invalidation_bus)
+
+# Önceki process'te yarım kalan shred purge'lerini sürdür
+crypto.schedule_purge()
 
 # Rate limiting for uploads and messages
 upload_rate_limit = {}
@@ -489,6 +496,27 @@ def api_response(success=True, data=None, error=None, code=None, status=200):
         response['code'] = code or 'UNKNOWN_ERROR'
     return jsonify(response), status
 
+def encode_response_data(data):
+    """api_response data kısmını bir kez JSON'a çevir: (body, etag)"""
+    body = app.json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.blake2b(body, digest_size=12).hexdigest()
+
+def encoded_api_response(data_body, etag):
+    """Önceden encode edilmiş data ile api_response zarfını döndür
+
+    Yalnızca timestamp her istekte üretilir; data baytları olduğu gibi
+    kopyalanır. Gövde timestamp yüzünden her seferinde değiştiği için ETag
+    zayıftır; If-None-Match eşleşirse gövdesiz 304 döner.
+    """
+    body = b''.join((
+        b'{"data":', data_body,
+        b',"success":true,"timestamp":"', datetime.now().isoformat().encode('ascii'), b'"}\n'
+    ))
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 # Socket.IO Error Handler
 @socketio.on_error_default
 def handle_socket_error(e):
@@ -613,20 +641,87 @@ def get_threads():
     if not session.get('admin'):
         return jsonify([]), 401
     
+    # Delta-sync: ?since=V yalnızca V'den sonra değişen/silinen thread'leri döndürür
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = max(int(since), 0)
+        except ValueError:
+            return jsonify({'error': 'Invalid since'}), 400
+        version = db.get_threads_version()
+
+        def load_changes():
+            threads, deleted, _ = db.get_thread_changes(since, version=version)
+            return {'threads': threads, 'deleted': deleted, 'version': version, 'full': since == 0}
+
+        changes = cached_thread_list(f'threads:since:{since}:{version}', load_changes)
+        return jsonify(dict(changes, online=presence.online_threads()))
+    
+    # Özet kolonları yazma anında güncellenir; liste tek index range scan
     if db.is_postgres:
-        order_clause = 'ORDER BY last_message_time DESC NULLS LAST'
+        order_clause = 'ORDER BY last_message_at DESC NULLS LAST'
     else:
-        order_clause = 'ORDER BY COALESCE(last_message_time, created_at) DESC'
+        order_clause = 'ORDER BY last_message_at DESC'
     
-    threads = db.execute_query(f'''
-        SELECT t.*, 
-               (SELECT content_text FROM messages WHERE thread_id = t.id ORDER BY created_at DESC LIMIT 1) as last_message,
-               (SELECT created_at FROM messages WHERE thread_id = t.id ORDER BY created_at DESC LIMIT 1) as last_message_time
-        FROM threads t
-        {order_clause}
-    ''')
+    def load_threads():
+        return db.execute_query(f'''
+            SELECT id, display_name, created_at, last_activity_at,
+                   last_message_at, last_message_preview, last_sender, message_count, unread_count
+            FROM threads
+            WHERE {LIVE_THREAD}
+            {order_clause}
+        ''')
+
+    threads = cached_thread_list(f'threads:all:{db.get_threads_version()}', load_threads)
     return jsonify(threads)
 
+def cached_thread_list(key, loader):
+    """Thread listesi okuması: kısa TTL micro-cache + single-flight
+
+    Anahtar sync versiyonunu içerdiği için herhangi bir thread değişikliği
+    yeni anahtar üretir; cache'ten eski liste dönmez.
+    """
+    use_cache = Config.THREAD_LIST_CACHE_TTL > 0
+    if use_cache:
+        result = thread_list_cache.get(key)
+        if result is not None:
+            return result
+
+    def load():
+        result = loader()
+        if use_cache:
+            thread_list_cache.set(key, result)
+        return result
+
+    return read_flight.do(key, load)
+
+def decrypt_message_rows(messages):
+    """Admin görünümü için metin mesajlarını yerinde çöz (sayfa tek iş olarak hub dışında)"""
+    encrypted = [msg for msg in messages if msg['content_text'] and msg['type'] == 'text']
+    texts = crypto.decrypt_many([(msg['content_text'], msg['thread_id']) for msg in encrypted])
+    for msg, text in zip(encrypted, texts):
+        if text is None:
+            logger.warning(f"Failed to decrypt message {msg['id']}")
+            text = UNREADABLE_PREVIEW
+        msg['content_text'] = text
+    return messages
+
+def count_thread_messages(thread_id):
+    """Thread'in mesaj sayısı: threads.message_count özetinden (PK okuması)
+
+    Özet mesaj insert'leriyle aynı writer transaction'ında güncellenir;
+    thread satırı yoksa COUNT(*)'a düşülür.
+    """
+    thread = db.execute_query('SELECT message_count FROM threads WHERE id = ?', (thread_id,), fetch='one')
+    if thread and thread['message_count'] is not None:
+        return thread['message_count']
+    total_result = db.execute_query(
+        f'SELECT COUNT(*) as count FROM messages WHERE thread_id = ? AND {VISIBLE_EPOCH}',
+        (thread_id, thread_id),
+        fetch='one'
+    )
+    return total_result['count'] if total_result else 0
+
 @app.route('/api/messages')
 def get_messages():
     if not session.get('admin'):
@@ -637,22 +732,103 @@ def get_messages():
         return api_response(success=False, error='Thread ID required', code='MISSING_THREAD_ID', status=400)
 
     # Pagination parameters
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 50))
+    per_page = max(1, min(int(request.args.get('per_page', 50)), 200))
+    if 'page' in request.args:
+        return get_messages_by_page(thread_id, int(request.args.get('page', 1)), per_page)
+
+    # Keyset (cursor) modu: before=<cursor> eski, after=<cursor> yeni mesajlar
+    try:
+        before = decode_cursor(request.args['before']) if request.args.get('before') else None
+        after = decode_cursor(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        return api_response(success=False, error='Invalid cursor', code='INVALID_CURSOR', status=400)
+    include_total = request.args.get('include_total') in ('1', 'true')
+
+    try:
+        page = None
+        cached = False
+        if before is None and after is None:
+            cache_key = thread_messages_key(thread_id, per_page)
+            variant = 'cursor_total' if include_total else 'cursor'
+            page, encoded = message_cache.get_with_encoded(cache_key, variant)
+            if encoded is not None:
+                # Tekrarlanan hit: JSON encode yok, yalnızca bayt kopyası
+                return encoded_api_response(*encoded)
+            cached = page is not None
+
+        if page is None:
+            def load_page():
+                generation = message_cache.thread_generation(thread_id)
+                messages, has_more = db.fetch_message_page(thread_id, per_page, before=before, after=after)
+                decrypt_message_rows(messages)
+                if messages:
+                    # before/ilk sayfa: en eski mesaj, after: en yeni mesaj
+                    edge = messages[-1] if after is not None else messages[0]
+                    next_cursor = encode_cursor(edge)
+                else:
+                    next_cursor = None
+                page = {'messages': messages, 'has_more': has_more, 'next_cursor': next_cursor}
+
+                # Cache first page messages (yükleme sırasında yeni mesaj geldiyse atlanır).
+                # total da saklanır; append_thread_message onu artırarak güncel tutar,
+                # böylece cache hit hiç DB'ye gitmez.
+                if before is None and after is None:
+                    page['total'] = count_thread_messages(thread_id) if has_more else len(messages)
+                    message_cache.set_thread_messages(thread_id, page, per_page, generation=generation)
+                return page
+
+            # Aynı sayfayı isteyen eşzamanlı istekler tek sorgu + decrypt paylaşır
+            flight_key = f"messages:{thread_id}:{per_page}:{request.args.get('before')}:{request.args.get('after')}"
+            page = read_flight.do(flight_key, load_page)
+
+        pagination_info = {
+            'per_page': per_page,
+            'has_more': page['has_more'],
+            'next_cursor': page['next_cursor'],
+            'direction': 'after' if after is not None else 'before',
+            'cached': cached,
+            # Cache hit'te istek hiç DB sorgusu çalıştırmaz
+            'db_io': not cached
+        }
+        if include_total:
+            total = page.get('total')
+            if total is None:
+                total = count_thread_messages(thread_id)
+                pagination_info['db_io'] = True
+            pagination_info['total'] = total
+
+        data = {
+            'messages': page['messages'],
+            'pagination': pagination_info
+        }
+        if cached and not pagination_info['db_io']:
+            # Sayfa değişene kadar (append/invalidation entry'yi değiştirir) aynı baytlar kullanılır
+            data_body, etag = encode_response_data(data)
+            message_cache.set_encoded(cache_key, page, variant, data_body, etag)
+            return encoded_api_response(data_body, etag)
+        return api_response(data=data)
+
+    except Exception as e:
+        logger.error(f"Error fetching messages: {e}")
+        return api_response(success=False, error='Failed to fetch messages', code='FETCH_ERROR', status=500)
+
+def get_messages_by_page(thread_id, page, per_page):
+    """Eski page/offset sayfalaması (geriye dönük uyumluluk)"""
     offset = (page - 1) * per_page
 
     try:
         # Try to get from cache first (only for first page)
         if page == 1:
-            cached_messages = message_cache.get_thread_messages(thread_id, per_page)
-            if cached_messages:
-                # Get total count separately
-                total_result = db.execute_query(
-                    'SELECT COUNT(*) as count FROM messages WHERE thread_id = ?',
-                    (thread_id,),
-                    fetch='one'
-                )
-                total = total_result['count'] if total_result else 0
+            cache_key = thread_messages_key(thread_id, per_page)
+            cached_page, encoded = message_cache.get_with_encoded(cache_key, 'page')
+            if encoded is not None:
+                return encoded_api_response(*encoded)
+            if cached_page:
+                total = cached_page.get('total')
+                db_io = False
+                if total is None:
+                    total = count_thread_messages(thread_id)
+                    db_io = True
 
                 pagination_info = {
                     'page': page,
@@ -660,43 +836,50 @@ def get_messages():
                     'total': total,
                     'pages': (total + per_page - 1) // per_page,
                     'has_more': page < ((total + per_page - 1) // per_page),
-                    'cached': True
+                    'cached': True,
+                    'db_io': db_io
                 }
 
-                return api_response(data={
-                    'messages': cached_messages,
+                data = {
+                    'messages': cached_page['messages'],
                     'pagination': pagination_info
-                })
-
-        # Get total count
-        total_result = db.execute_query(
-            'SELECT COUNT(*) as count FROM messages WHERE thread_id = ?',
-            (thread_id,),
-            fetch='one'
-        )
-        total = total_result['count'] if total_result else 0
-
-        # Get paginated messages
-        messages = db.execute_query(
-            'SELECT * FROM messages WHERE thread_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?',
-            (thread_id, per_page, offset)
-        )
-
-        # Decrypt text messages for admin view
-        for msg in messages:
-            if msg['content_text'] and msg['type'] == 'text':
-                try:
-                    msg['content_text'] = decrypt_message(msg['content_text'], ENCRYPTION_KEY)
-                except Exception as e:
-                    logger.warning(f"Failed to decrypt message {msg['id']}: {e}")
-                    msg['content_text'] = "[Şifrelenmiş mesaj okunamıyor]"
-
-        # Reverse to show chronological order (oldest first)
-        messages.reverse()
-
-        # Cache first page messages
-        if page == 1:
-            message_cache.set_thread_messages(thread_id, messages, per_page)
+                }
+                if not db_io:
+                    data_body, etag = encode_response_data(data)
+                    message_cache.set_encoded(cache_key, cached_page, 'page', data_body, etag)
+                    return encoded_api_response(data_body, etag)
+                return api_response(data=data)
+
+        def load_page():
+            generation = message_cache.thread_generation(thread_id)
+
+            # Get total count
+            total = count_thread_messages(thread_id)
+
+            # Get paginated messages (temizlenmiş epoch'lar hariç, count ile aynı küme)
+            messages = [MessageRecord.from_row(row) for row in db.execute_query(
+                f'SELECT {MESSAGE_SELECT} FROM messages WHERE thread_id = ? AND {VISIBLE_EPOCH} '
+                'ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?',
+                (thread_id, thread_id, per_page, offset)
+            )]
+
+            # Decrypt text messages for admin view
+            decrypt_message_rows(messages)
+
+            # Reverse to show chronological order (oldest first)
+            messages.reverse()
+
+            # Cache first page messages
+            if page == 1:
+                message_cache.set_thread_messages(thread_id, {
+                    'messages': messages,
+                    'has_more': total > per_page,
+                    'next_cursor': encode_cursor(messages[0]) if messages else None,
+                    'total': total
+                }, per_page, generation=generation)
+            return total, messages
+
+        total, messages = read_flight.do(f'messages_page:{thread_id}:{page}:{per_page}', load_page)
 
         pagination_info = {
             'page': page,
@@ -704,7 +887,8 @@ def get_messages():
             'total': total,
             'pages': (total + per_page - 1) // per_page,
             'has_more': page < ((total + per_page - 1) // per_page),
-            'cached': False
+            'cached': False,
+            'db_io': True
         }
 
         return api_response(data={
@@ -840,8 +1024,9 @@ def clear_thread():
         return api_response(success=False, error='Thread ID required', code='MISSING_THREAD_ID', status=400)
 
     try:
-        db.execute_query('DELETE FROM messages WHERE thread_id = ?', (thread_id,), fetch=None)
-        db.execute_query('DELETE FROM telegram_links WHERE thread_id = ?', (thread_id,), fetch=None)
+        db.clear_thread_messages(thread_id)
+        crypto.thread_shredded(thread_id)
+        message_cache.invalidate_thread(thread_id)
         return api_response(data={'message': 'Thread cleared successfully'})
     except Exception as e:
         logger.error(f"Error clearing thread {thread_id}: {e}")
@@ -853,16 +1038,26 @@ def clear_all():
         return api_response(success=False, error='Unauthorized', code='UNAUTHORIZED', status=401)
 
     try:
-        db.execute_query('DELETE FROM messages', fetch=None)
-        db.execute_query('DELETE FROM threads', fetch=None)
-        db.execute_query('DELETE FROM telegram_links', fetch=None)
-        db.execute_query('DELETE FROM telegram_inbound', fetch=None)
+        db.delete_all_threads()
+        crypto.thread_shredded()
+        message_cache.clear()
+        thread_list_cache.clear()
         return api_response(data={'message': 'All data cleared successfully'})
     except Exception as e:
         logger.error(f"Error clearing all data: {e}")
         return api_response(success=False, error='Failed to clear all data', code='CLEAR_ALL_ERROR', status=500)
 
 
+@app.route('/api/admin/reencrypt', methods=['POST'])
+def reencrypt_messages():
+    """Anahtar rotasyonundan sonra eski mesajları arka planda yeni anahtara taşı"""
+    if not session.get('admin'):
+        return api_response(success=False, error='Unauthorized', code='UNAUTHORIZED', status=401)
+
+    batch_size = max(1, min(int(request.args.get('batch_size', 500)), 5000))
+    if not crypto.start_reencryption(batch_size):
+        return api_response(success=False, error='Re-encryption already running', code='REENCRYPT_RUNNING', status=409)
+    return api_response(data={'message': 'Re-encryption started', 'batch_size': batch_size}, status=202)
 
 # Socket.IO
 @socketio.on('join')
@@ -870,14 +1065,11 @@ def handle_join(data):
     thread_id = str(uuid.uuid4())
     display_name = data.get('display_name', 'Ziyaretçi')
     
-    db.execute_query(
-        'INSERT INTO threads (id, display_name) VALUES (?, ?)',
-        (thread_id, display_name),
-        fetch=None
-    )
+    db.create_thread(thread_id, display_name)
     
     join_room(thread_id)
     emit('joined', {'thread_id': thread_id})
+    presence.touch(thread_id)
 
 @socketio.on('rejoin')
 def handle_rejoin(data):
@@ -885,13 +1077,14 @@ def handle_rejoin(data):
     if thread_id:
         # Thread var mı kontrol et
         thread = db.execute_query(
-            'SELECT id FROM threads WHERE id = ?',
+            f'SELECT id FROM threads WHERE id = ? AND {LIVE_THREAD}',
             (thread_id,),
             fetch='one'
         )
         if thread:
             join_room(thread_id)
             emit('joined', {'thread_id': thread_id})
+            presence.touch(thread_id)
         else:
             # Thread bulunamadı - session'ı temizle
             logger.warning(f"Thread bulunamadı, session temizleniyor: {thread_id}")
@@ -904,17 +1097,55 @@ def handle_rejoin(data):
 def handle_admin_join():
     join_room('admin_room')
 
+def build_thread_patch(thread):
+    """thread_updated event'i için kompakt thread özeti"""
+    last_message_at = thread.get('last_message_at')
+    return {
+        'id': thread['id'],
+        'last_message_preview': thread.get('last_message_preview'),
+        'last_message_at': str(last_message_at) if last_message_at else None,
+        'last_sender': thread.get('last_sender'),
+        'message_count': thread.get('message_count'),
+        'unread_count': thread.get('unread_count'),
+        'online': presence.is_online(thread['id']),
+        'version': thread.get('version')
+    }
+
+def emit_thread_updates(threads):
+    """Write-behind flush'ında özeti değişen thread'leri admin paneline gönder"""
+    for thread in threads:
+        socketio.emit('thread_updated', build_thread_patch(thread), room='admin_room')
+
+db.writer.add_listener(emit_thread_updates)
+
+def emit_presence_change(thread_id, online):
+    """Admin paneline yalnızca çevrimiçi/çevrimdışı geçişlerini gönder"""
+    event = 'visitor_online' if online else 'visitor_offline'
+    socketio.emit(event, {'thread_id': thread_id}, room='admin_room')
+
+presence.add_listener(emit_presence_change)
+db.add_delete_listener(presence.threads_deleted)
+
+@socketio.on('mark_thread_read')
+def handle_mark_thread_read(data):
+    if not session.get('admin'):
+        return
+    thread_id = (data or {}).get('thread_id')
+    if not thread_id:
+        return
+    try:
+        thread = db.mark_thread_read(thread_id)
+        if thread:
+            emit('thread_updated', build_thread_patch(thread), room='admin_room')
+    except Exception as e:
+        logger.error(f"Mark read error for thread {thread_id}: {e}")
+
 @socketio.on('heartbeat')
 def handle_heartbeat(data):
     thread_id = data.get('thread_id')
     if thread_id:
-        current_time = db.get_current_timestamp()
-        db.execute_query(
-            "UPDATE threads SET last_activity_at = ? WHERE id = ?",
-            (current_time, thread_id),
-            fetch=None
-        )
-        emit('visitor_online', {'thread_id': thread_id}, room='admin_room')
+        # Bellekte güncellenir; last_activity_at periyodik batch ile yazılır
+        presence.touch(thread_id)
 
 @socketio.on('message_to_admin')
 @rate_limit('message')
@@ -942,35 +1173,24 @@ def handle_message_to_admin(data):
     thread_id = data.get('thread_id')
     msg_type = data.get('type', 'text')
 
-    msg_id = str(uuid.uuid4())
     content_text = data.get('text', '')
     file_path = data.get('file_url', '')
 
     try:
-        # Encrypt message content if it's text
-        encrypted_content = encrypt_message(content_text, ENCRYPTION_KEY) if content_text and msg_type == 'text' else content_text
-
-        db.execute_query(
-            'INSERT INTO messages (id, thread_id, sender, type, content_text, file_path) VALUES (?, ?, ?, ?, ?, ?)',
-            (msg_id, thread_id, 'visitor', msg_type, encrypted_content, file_path),
-            fetch=None
-        )
-
-        # Decrypt for sending to admin
-        msg = db.execute_query('SELECT * FROM messages WHERE id = ?', (msg_id,), fetch='one')
-        if msg and msg['content_text'] and msg['type'] == 'text':
-            msg['content_text'] = decrypt_message(msg['content_text'], ENCRYPTION_KEY)
+        # Encrypt + kaydet; düz metin DTO tek round trip'te döner
+        msg = db.insert_message(thread_id, 'visitor', msg_type, content_text, file_path, encrypt=encrypt_for_storage)
+        presence.touch(thread_id)
 
         emit('message_from_visitor', msg, room='admin_room')
 
-        # Invalidate cache for this thread
-        message_cache.invalidate_thread(thread_id)
+        # Cache'teki ilk sayfaya ekle (invalidate yerine; sonraki okuma hit olur)
+        message_cache.append_thread_message(thread_id, msg)
 
         # Send notification to admin about new message
-        thread = db.execute_query('SELECT display_name FROM threads WHERE id = ?', (thread_id,), fetch='one')
+        thread = db.execute_query(f'SELECT display_name FROM threads WHERE id = ? AND {LIVE_THREAD}', (thread_id,), fetch='one')
         if thread:
             # Create message preview (first 50 characters)
-            message_preview = content_text[:50] + ('...' if len(content_text) > 50 else '') if content_text else 'Medya mesajı'
+            message_preview = build_message_preview(content_text)
 
             emit('new_message_notification', {
                 'thread_id': thread_id,
@@ -980,7 +1200,6 @@ def handle_message_to_admin(data):
             }, room='admin_room')
 
         if telegram_bot and Config.TELEGRAM_CHAT_ID and msg_type == 'text' and telegram_loop:
-            thread = db.execute_query('SELECT display_name FROM threads WHERE id = ?', (thread_id,), fetch='one')
             if thread:
                 try:
                     async def send_telegram():
@@ -1028,30 +1247,18 @@ def handle_message_to_visitor(data):
     thread_id = data.get('thread_id')
     msg_type = data.get('type', 'text')
 
-    msg_id = str(uuid.uuid4())
     content_text = data.get('text', '')
     file_path = data.get('file_url', '')
 
     try:
-        # Encrypt message content if it's text
-        encrypted_content = encrypt_message(content_text, ENCRYPTION_KEY) if content_text and msg_type == 'text' else content_text
-
-        db.execute_query(
-            'INSERT INTO messages (id, thread_id, sender, type, content_text, file_path) VALUES (?, ?, ?, ?, ?, ?)',
-            (msg_id, thread_id, 'admin', msg_type, encrypted_content, file_path),
-            fetch=None
-        )
-
-        # Decrypt for sending to visitor
-        msg = db.execute_query('SELECT * FROM messages WHERE id = ?', (msg_id,), fetch='one')
-        if msg and msg['content_text'] and msg['type'] == 'text':
-            msg['content_text'] = decrypt_message(msg['content_text'], ENCRYPTION_KEY)
+        # Encrypt + kaydet; düz metin DTO tek round trip'te döner
+        msg = db.insert_message(thread_id, 'admin', msg_type, content_text, file_path, encrypt=encrypt_for_storage)
 
         emit('message_from_admin', msg, room=thread_id)
         emit('message_from_telegram', msg, room='admin_room', include_self=False)
 
-        # Invalidate cache for this thread
-        message_cache.invalidate_thread(thread_id)
+        # Cache'teki ilk sayfaya ekle (invalidate yerine; sonraki okuma hit olur)
+        message_cache.append_thread_message(thread_id, msg)
     except Exception as e:
         logger.error(f"Admin message save error: {e}")
         # DB hatası durumunda kullanıcıya bildir
@@ -1060,17 +1267,6 @@ def handle_message_to_visitor(data):
             'message': 'Mesaj kaydedilemedi'
         }, room='admin_room')
 
-# Uygulama ilk HTTP isteğinde DB şemasını garanti et
-@app.before_request
-def ensure_db_initialized():
-    if not hasattr(app, '_db_initialized'):
-        try:
-            db.init_db()
-            logger.info('Database initialized (before_request)')
-            app._db_initialized = True
-        except Exception as e:
-            logger.error(f'DB init failed: {e}')
-
 # Metrics Collector Class
 class MetricsCollector:
     def __init__(self):
@@ -1141,6 +1337,15 @@ def health_check():
 
     # Add metrics
     health_status['metrics'] = metrics.get_stats()
+    health_status['write_behind'] = db.writer.get_stats()
+    health_status['presence'] = presence.get_stats()
+    cache_stats = message_cache.get_stats()
+    health_status['cache'] = {
+        key: cache_stats[key]
+        for key in ('backend', 'hit_ratio', 'hits', 'misses', 'sets', 'expirations', 'evictions', 'invalidations',
+                    'entries', 'bytes', 'max_size', 'max_bytes', 'ttl', 'lookup_us_avg', 'errors')
+        if key in cache_stats
+    }
 
     status_code = 200 if health_status['status'] == 'healthy' else 503
     return api_response(data=health_status, status=status_code)
@@ -1151,7 +1356,16 @@ def get_metrics():
     if not session.get('admin'):
         return api_response(success=False, error='Unauthorized', code='UNAUTHORIZED', status=401)
 
-    return api_response(data=metrics.get_stats())
+    stats = metrics.get_stats()
+    stats['write_behind'] = db.writer.get_stats()
+    stats['presence'] = presence.get_stats()
+    stats['message_cache'] = message_cache.get_stats()
+    stats['single_flight'] = read_flight.get_stats()
+    stats['invalidation_bus'] = invalidation_bus.get_stats()
+    stats['thread_list_cache'] = thread_list_cache.get_stats()
+    stats['crypto'] = crypto.get_stats()
+    stats['blocking_executor'] = blocking_executor.get_stats()
+    return api_response(data=stats)
 
 # 🔍 TEST DASHBOARD ROUTE
 @app.route('/test')
@@ -1180,7 +1394,8 @@ def repair_db():
         # Safe cleanup - only delete messages older than 30 days (not 7)
         deleted_count = db.execute_query("SELECT COUNT(*) FROM messages WHERE created_at < datetime('now', '-30 days')")
         if deleted_count and deleted_count[0][0] > 0:
-            db.execute_query("DELETE FROM messages WHERE created_at < datetime('now', '-30 days')")
+            db.execute_query("DELETE FROM messages WHERE created_at < datetime('now', '-30 days')", fetch=None)
+            db.rebuild_thread_summaries(decrypt=decrypt_from_storage)
             logger.info(f"Cleaned {deleted_count[0][0]} old messages")
         
         # Safe vacuum - only if database is not too large
@@ -2550,8 +2765,9 @@ def repair_db_cleanup():
         if not data or not data.get('repair'):
             return jsonify({'error': 'Repair mode required'}), 400
         
-        # Eski mesajları temizle
-        result = db.execute_query("DELETE FROM messages WHERE created_at < datetime('now', '-7 days')")
+        # Eski mesajları temizle; thread özetleri (ve delta-sync versiyonu) yeniden hesaplanır
+        db.execute_query("DELETE FROM messages WHERE created_at < datetime('now', '-7 days')", fetch=None)
+        db.rebuild_thread_summaries(decrypt=decrypt_from_storage)
         return jsonify({'success': True, 'message': 'Old messages cleaned up'})
     except Exception as e:
         logger.error(f"Database cleanup failed: {e}")
@@ -2821,7 +3037,8 @@ def run_automatic_repair():
         # Database repair
         try:
             db.execute_query("VACUUM")
-            db.execute_query("DELETE FROM messages WHERE created_at < datetime('now', '-7 days')")
+            db.execute_query("DELETE FROM messages WHERE created_at < datetime('now', '-7 days')", fetch=None)
+            db.rebuild_thread_summaries(decrypt=decrypt_from_storage)
             repair_results['repairs']['Database'] = {'status': '✅', 'message': 'Database optimize edildi'}
             repair_results['total_fixed'] += 1
         except Exception as e:
@@ -2987,9 +3204,6 @@ def start_scheduler():
         logger.error(f"Scheduler başlatma hatası: {e}")
 
 if __name__ == '__main__':
-    db.init_db()
-    logger.info('Database initialized')
-
     # Scheduler'ı başlat
     start_scheduler()
 
@@ -1,92 +1,784 @@
+import sys
+import json
 import time
+import zlib
+import logging
 import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
 from functools import wraps
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from config import Config
+from database import encode_cursor, MessageRecord
 
-class MessageCache:
-    """Thread-safe message caching system - Railway optimized"""
+try:
+    import redis
+except ImportError:
+    redis = None
 
-    def __init__(self, max_size: int = 500, ttl: int = 180):  # Railway için azaltılmış TTL (3 dakika)
+logger = logging.getLogger(__name__)
+
+def thread_messages_key(thread_id: str, limit: int) -> str:
+    return f"thread_messages:{thread_id}:{limit}"
+
+class CacheBackend:
+    """Interface shared by the in-process and Redis message caches
+
+    Values are first pages of a thread: {'messages', 'has_more',
+    'next_cursor', optional 'total'}. Generations guard against caching a
+    page that was loaded before a concurrent write.
+    """
+
+    backend_name = 'base'
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, thread_id: Optional[str] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def thread_generation(self, thread_id: str) -> int:
+        raise NotImplementedError
+
+    def set_thread_messages(self, thread_id: str, messages: Any, limit: int = 50,
+                            generation: Optional[int] = None):
+        raise NotImplementedError
+
+    def append_thread_message(self, thread_id: str, message: Dict[str, Any]):
+        raise NotImplementedError
+
+    def invalidate_thread(self, thread_id: str):
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get_thread_messages(self, thread_id: str, limit: int = 50) -> Optional[Any]:
+        """Get cached messages for a thread"""
+        return self.get(thread_messages_key(thread_id, limit))
+
+    def get_with_encoded(self, key: str, variant: str) -> Tuple[Optional[Any], Optional[Tuple[bytes, str]]]:
+        """Value plus its pre-encoded (body, etag) for a response variant, if stored"""
+        return self.get(key), None
+
+    def set_encoded(self, key: str, value: Any, variant: str, body: bytes, etag: str):
+        """Attach an encoded response to the entry; backends may ignore it"""
+
+    def _record_lookup(self, key: str, hit: bool, started: float):
+        """Hit/miss counters per key prefix and lookup latency (lock wait included)"""
+        stats = self._stats
+        stats['hits' if hit else 'misses'] += 1
+        prefix = stats['prefixes'].get(key.split(':', 1)[0])
+        if prefix is None:
+            prefix = stats['prefixes'][key.split(':', 1)[0]] = {'hits': 0, 'misses': 0}
+        prefix['hits' if hit else 'misses'] += 1
+        elapsed_us = (time.perf_counter() - started) * 1_000_000
+        stats['lookup_us_total'] += elapsed_us
+        if elapsed_us > stats['lookup_us_max']:
+            stats['lookup_us_max'] = elapsed_us
+
+    @staticmethod
+    def _summarize_lookups(stats: Dict[str, Any]):
+        """Turn raw lookup counters into hit ratios and average latency"""
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['lookup_us_avg'] = round(stats['lookup_us_total'] / lookups, 2) if lookups else 0.0
+        stats['lookup_us_max'] = round(stats['lookup_us_max'], 2)
+        del stats['lookup_us_total']
+        for counts in stats['prefixes'].values():
+            prefix_lookups = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = round(counts['hits'] / prefix_lookups, 4) if prefix_lookups else None
+
+def append_to_page(page: Any, message: Dict[str, Any], limit: int) -> Optional[Dict[str, Any]]:
+    """Return a copy of a cached first page with the message appended
+
+    The page stays in (created_at, id) order and is trimmed to limit.
+    Returns the page itself if the message is already in it and None if
+    the value is not a page.
+    """
+    if not isinstance(page, dict) or 'messages' not in page:
+        return None
+    messages = page['messages']
+    if any(m.get('id') == message['id'] for m in messages):
+        return page
+    messages = messages + [message]
+    if len(messages) > 1 and _message_order(messages[-1]) < _message_order(messages[-2]):
+        messages.sort(key=_message_order)
+    new_page = dict(page, messages=messages[-limit:])
+    if len(messages) > limit:
+        new_page['has_more'] = True
+        new_page['next_cursor'] = encode_cursor(new_page['messages'][0])
+    if page.get('total') is not None:
+        new_page['total'] = page['total'] + 1
+    return new_page
+
+class MessageCache(CacheBackend):
+    """Thread-safe in-process message cache - Railway optimized
+
+    Entries live in an LRU-ordered dict; a second ordered dict keeps keys in
+    write order, which is also expiry order because every entry gets the
+    same TTL. get/set/evict are amortized O(1): expired entries are popped
+    from the head of the expiry queue and the LRU victim is the head of the
+    access order. A thread_id -> keys index lets invalidate_thread touch only
+    that thread's entries. Besides the entry cap, an optional byte budget
+    (max_bytes) bounds the approximate resident size of all values. Page
+    messages are stored as slotted MessageRecords rather than row dicts.
+    """
+
+    backend_name = 'memory'
+
+    def __init__(self, max_size: int = 500, ttl: int = 180,  # Railway için azaltılmış TTL (3 dakika)
+                 max_bytes: Optional[int] = None):
         self.max_size = max_size
         self.ttl = ttl
-        self._cache: Dict[str, Dict[str, Any]] = {}
+        self.max_bytes = max_bytes
+        self._sizes: Dict[str, int] = {}  # key -> yaklaşık byte
+        self._bytes = 0
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()  # key -> value, LRU sırası
+        self._expiry: "OrderedDict[str, float]" = OrderedDict()  # key -> expires_at, yazma sırası
+        self._thread_keys: Dict[str, Set[str]] = {}  # thread_id -> keys
+        self._key_thread: Dict[str, str] = {}  # key -> thread_id
+        # thread_id -> son yazmanın sıra numarası; kaydı olmayan thread'ler _generation_floor'dadır.
+        # Sayı global olarak artar, böylece budanan bir thread eski bir değere geri dönmez.
+        self._generations: Dict[str, int] = {}
+        self._generation_seq = 0
+        self._generation_floor = 0
+        self._max_generations = max(2 * max_size, 1024)
+        self._encoded: Dict[str, Dict[str, Tuple[bytes, str]]] = {}  # key -> variant -> (body, etag)
         self._lock = threading.RLock()
+        self._bus = None
+        self._bus_scope = ''
+        self._stats = {
+            'lock_acquisitions': 0,
+            'lock_hold_ms_total': 0.0,
+            'lock_hold_ms_max': 0.0,
+            'hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'lookup_us_total': 0.0,
+            'lookup_us_max': 0.0,
+            'prefixes': {},
+            'invalidations': 0,
+            'invalidated_keys': 0,
+            'appends': 0,
+            'stale_sets_skipped': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'oversize_rejected': 0,
+            'encoded_hits': 0,
+            'encoded_sets': 0,
+        }
+
+    @contextmanager
+    def _locked(self):
+        """Acquire the cache lock and record how long it was held"""
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                held_ms = (time.perf_counter() - started) * 1000
+                stats = self._stats
+                stats['lock_acquisitions'] += 1
+                stats['lock_hold_ms_total'] += held_ms
+                if held_ms > stats['lock_hold_ms_max']:
+                    stats['lock_hold_ms_max'] = held_ms
+
+    def _unindex(self, key: str):
+        thread_id = self._key_thread.pop(key, None)
+        if thread_id is not None:
+            keys = self._thread_keys.get(thread_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._thread_keys[thread_id]
+
+    def _remove(self, key: str):
+        self._cache.pop(key, None)
+        self._encoded.pop(key, None)
+        self._expiry.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+        self._unindex(key)
+
+    def _evict_lru(self):
+        self._remove(next(iter(self._cache)))
+        self._stats['evictions'] += 1
+
+    def _store(self, key: str, value: Any, size: int):
+        """Replace the value of a key and update byte accounting
 
-    def _is_expired(self, entry: Dict[str, Any]) -> bool:
-        """Check if cache entry is expired"""
-        return time.time() - entry['timestamp'] > self.ttl
+        Encoded responses belong to the old value and are dropped with it.
+        """
+        self._cache[key] = value
+        self._encoded.pop(key, None)
+        self._bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
 
-    def _cleanup_expired(self):
-        """Remove expired entries"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, entry in self._cache.items()
-            if current_time - entry['timestamp'] > self.ttl
-        ]
-        for key in expired_keys:
-            del self._cache[key]
+    def _cleanup_expired(self, now: Optional[float] = None):
+        """Remove expired entries from the head of the expiry queue"""
+        now = time.monotonic() if now is None else now
+        expiry = self._expiry
+        while expiry:
+            key, expires_at = next(iter(expiry.items()))
+            if expires_at > now:
+                break
+            self._remove(key)
+            self._stats['expirations'] += 1
 
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
-        with self._lock:
-            if key in self._cache:
-                entry = self._cache[key]
-                if not self._is_expired(entry):
-                    return entry['value']
-                else:
-                    del self._cache[key]
-            return None
-
-    def set(self, key: str, value: Any):
-        """Set value in cache"""
-        with self._lock:
-            # Cleanup expired entries if cache is getting full
-            if len(self._cache) >= self.max_size:
-                self._cleanup_expired()
-
-            # If still full, remove oldest entries
-            if len(self._cache) >= self.max_size:
-                oldest_key = min(
-                    self._cache.keys(),
-                    key=lambda k: self._cache[k]['timestamp']
-                )
-                del self._cache[oldest_key]
-
-            self._cache[key] = {
-                'value': value,
-                'timestamp': time.time()
-            }
+        started = time.perf_counter()
+        with self._locked():
+            return self._get_unlocked(key, started)
+
+    def _get_unlocked(self, key: str, started: float) -> Optional[Any]:
+        """Lookup under an already held lock (expired entries are removed)"""
+        expires_at = self._expiry.get(key)
+        if expires_at is None:
+            value = None
+        elif expires_at <= time.monotonic():
+            self._remove(key)
+            self._stats['expirations'] += 1
+            value = None
+        else:
+            self._cache.move_to_end(key)
+            value = self._cache[key]
+        self._record_lookup(key, value is not None, started)
+        return value
+
+    def get_with_encoded(self, key: str, variant: str) -> Tuple[Optional[Any], Optional[Tuple[bytes, str]]]:
+        """Value plus its pre-encoded (body, etag) for a response variant"""
+        started = time.perf_counter()
+        with self._locked():
+            value = self._get_unlocked(key, started)
+            if value is None:
+                return None, None
+            encoded = self._encoded.get(key, {}).get(variant)
+            if encoded is not None:
+                self._stats['encoded_hits'] += 1
+            return value, encoded
+
+    def set_encoded(self, key: str, value: Any, variant: str, body: bytes, etag: str):
+        """Attach an encoded response to the entry
+
+        Ignored if the entry was replaced (append, invalidation) after value
+        was read: the body would describe an old page.
+        """
+        with self._locked():
+            if self._cache.get(key) is not value:
+                return
+            variants = self._encoded.setdefault(key, {})
+            previous = variants.get(variant)
+            extra_bytes = len(body) - (len(previous[0]) if previous else 0)
+            if self._over_budget(extra_bytes):
+                return
+            variants[variant] = (body, etag)
+            self._sizes[key] += extra_bytes
+            self._bytes += extra_bytes
+            self._stats['encoded_sets'] += 1
+
+    def set(self, key: str, value: Any, thread_id: Optional[str] = None):
+        """Set value in cache; thread_id makes the entry invalidatable per thread"""
+        with self._locked():
+            self._set(key, value, thread_id)
+
+    def _set(self, key: str, value: Any, thread_id: Optional[str] = None):
+        self._stats['sets'] += 1
+        now = time.monotonic()
+        size = estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Tek başına bütçeyi aşan değer cache'lenmez
+            self._remove(key)
+            self._stats['oversize_rejected'] += 1
+            return
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self._expiry.move_to_end(key)
+            extra_bytes = size - self._sizes.get(key, 0)
+        else:
+            extra_bytes = size
+            if len(self._cache) >= self.max_size or self._over_budget(extra_bytes):
+                self._cleanup_expired(now)
+            # If still full, evict least recently used
+            while len(self._cache) >= self.max_size:
+                self._evict_lru()
+        while self._over_budget(extra_bytes) and next(iter(self._cache), key) != key:
+            self._evict_lru()
+        self._store(key, value, size)
+        self._expiry[key] = now + self.ttl
+        if thread_id is not None and self._key_thread.get(key) != thread_id:
+            self._unindex(key)
+            self._key_thread[key] = thread_id
+            self._thread_keys.setdefault(thread_id, set()).add(key)
 
     def delete(self, key: str):
         """Delete entry from cache"""
-        with self._lock:
-            self._cache.pop(key, None)
+        with self._locked():
+            self._remove(key)
+
+    def attach_bus(self, bus, scope: str):
+        """Publish invalidations to other workers' caches and apply theirs
+
+        Only needed for the in-process backend: each worker has its own copy.
+        Appends are published as invalidations because peers do not have
+        the message; they go through publish_async, batched off the
+        message path.
+        """
+        self._bus = bus
+        self._bus_scope = scope
+        bus.subscribe(self._on_remote_invalidation)
+
+    def _publish(self, action: str, key: str = '', batched: bool = False):
+        if self._bus is not None:
+            publish = self._bus.publish_async if batched else self._bus.publish
+            publish(f'{self._bus_scope}.{action}', key)
+
+    def _on_remote_invalidation(self, kind: str, key: str):
+        scope, _, action = kind.partition('.')
+        if scope != self._bus_scope:
+            return
+        if action == 'thread':
+            self._invalidate_local(key)
+        elif action == 'clear':
+            self._clear_local()
 
     def clear(self):
         """Clear all cache entries"""
-        with self._lock:
+        self._clear_local()
+        self._publish('clear')
+
+    def _clear_local(self):
+        with self._locked():
             self._cache.clear()
+            self._expiry.clear()
+            self._thread_keys.clear()
+            self._key_thread.clear()
+            self._generations.clear()
+            # Clear sırasında yüklenen sayfalar (eski generation'lar) yazılmaz
+            self._generation_seq += 1
+            self._generation_floor = self._generation_seq
+            self._encoded.clear()
+            self._sizes.clear()
+            self._bytes = 0
 
-    def get_thread_messages(self, thread_id: str, limit: int = 50) -> Optional[list]:
-        """Get cached messages for a thread"""
-        return self.get(f"thread_messages:{thread_id}:{limit}")
+    def _over_budget(self, extra_bytes: int = 0) -> bool:
+        return self.max_bytes is not None and self._bytes + extra_bytes > self.max_bytes
+
+    def thread_generation(self, thread_id: str) -> int:
+        """Write counter of a thread; read it before loading a page from the DB"""
+        with self._lock:
+            return self._generations.get(thread_id, self._generation_floor)
+
+    def _bump_generation(self, thread_id: str):
+        """Record a write/invalidation; past the bound, threads without cached pages are pruned
+
+        Pruned threads report the floor (the current sequence number). Every
+        generation read before the prune is smaller, so pruning can at most
+        skip caching a concurrent load; it never lets a stale page in.
+        """
+        self._generation_seq += 1
+        self._generations[thread_id] = self._generation_seq
+        if len(self._generations) > self._max_generations:
+            self._generations = {tid: gen for tid, gen in self._generations.items() if tid in self._thread_keys}
+            self._generation_floor = self._generation_seq
 
-    def set_thread_messages(self, thread_id: str, messages: list, limit: int = 50):
-        """Cache messages for a thread"""
-        self.set(f"thread_messages:{thread_id}:{limit}", messages)
+    def set_thread_messages(self, thread_id: str, messages: Any, limit: int = 50,
+                            generation: Optional[int] = None):
+        """Cache messages for a thread
+
+        With generation, the page is dropped if a message was appended or the
+        thread was invalidated while it was being loaded (it would be stale).
+        """
+        with self._locked():
+            if generation is not None and generation != self._generations.get(thread_id, self._generation_floor):
+                self._stats['stale_sets_skipped'] += 1
+                return
+            self._set(thread_messages_key(thread_id, limit), compact_page(messages), thread_id=thread_id)
+
+    def append_thread_message(self, thread_id: str, message: Dict[str, Any]):
+        """Append a persisted (plaintext) message to the thread's cached first pages
+
+        Pages are replaced, not mutated, because readers may be serializing
+        the old page object. Each page is trimmed to its per_page limit.
+        """
+        message = MessageRecord.from_row(message)
+        with self._locked():
+            self._bump_generation(thread_id)
+            for key in list(self._thread_keys.get(thread_id, ())):
+                page = self._cache.get(key)
+                new_page = append_to_page(page, message, int(key.rsplit(':', 1)[1]))
+                if new_page is None:
+                    self._remove(key)
+                elif new_page is not page:
+                    self._store(key, new_page, estimate_size(new_page))
+            while self._over_budget() and len(self._cache) > 1:
+                self._evict_lru()
+            self._stats['appends'] += 1
+        self._publish('thread', thread_id, batched=True)
 
     def invalidate_thread(self, thread_id: str):
-        """Invalidate all cache entries for a thread"""
+        """Invalidate all cache entries for a thread (in every worker)"""
+        self._invalidate_local(thread_id)
+        self._publish('thread', thread_id)
+
+    def _invalidate_local(self, thread_id: str):
+        with self._locked():
+            self._bump_generation(thread_id)
+            keys = self._thread_keys.pop(thread_id, None)
+            if not keys:
+                return
+            for key in keys:
+                self._remove(key)
+            self._stats['invalidations'] += 1
+            self._stats['invalidated_keys'] += len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters, per-prefix hit ratios, sizes and latencies"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['prefixes'] = {name: dict(counts) for name, counts in self._stats['prefixes'].items()}
+            stats['size'] = len(self._cache)
+            stats['entries'] = len(self._cache)
+            stats['bytes'] = self._bytes
+            stats['indexed_threads'] = len(self._thread_keys)
+            stats['tracked_generations'] = len(self._generations)
+        acquisitions = stats['lock_acquisitions']
+        stats['lock_hold_ms_avg'] = round(stats['lock_hold_ms_total'] / acquisitions, 4) if acquisitions else 0.0
+        stats['lock_hold_ms_total'] = round(stats['lock_hold_ms_total'], 3)
+        stats['lock_hold_ms_max'] = round(stats['lock_hold_ms_max'], 4)
+        self._summarize_lookups(stats)
+        stats['max_size'] = self.max_size
+        stats['max_bytes'] = self.max_bytes
+        stats['ttl'] = self.ttl
+        stats['backend'] = self.backend_name
+        return stats
+
+def estimate_size(value: Any) -> int:
+    """Approximate resident bytes of a cached value
+
+    Walks dicts/lists/tuples and sums sys.getsizeof of containers and leaf
+    values. Dict keys are skipped: row keys are shared interned strings.
+    """
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, MessageRecord):
+            # sender/type intern edilmiş, paylaşılan string'ler: sayılmaz
+            stack.extend((obj.id, obj.thread_id, obj.content_text, obj.file_path, obj.created_at))
+    return size
+
+def compact_page(page: Any) -> Any:
+    """Copy of a page whose messages are MessageRecords (other values as-is)"""
+    if not isinstance(page, dict) or 'messages' not in page:
+        return page
+    return dict(page, messages=[MessageRecord.from_row(m) for m in page['messages']])
+
+def _message_order(message: Dict[str, Any]):
+    """Keyset sırası: (created_at, id)"""
+    return (str(message.get('created_at')), message.get('id') or '')
+
+def _json_default(value: Any):
+    if isinstance(value, MessageRecord):
+        return value.to_dict()
+    if isinstance(value, (datetime, date)):
+        # DB satırlarındaki timestamp'ler SQLite ile aynı formatta saklanır
+        return value.isoformat(sep=' ')
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+class RedisMessageCache(CacheBackend):
+    """Message cache shared by all workers through a Redis-protocol server
+
+    Values are compact JSON, zlib-compressed above compress_min bytes, and
+    stored with native TTLs (SET EX). A per-thread set indexes the thread's
+    keys for invalidation; a per-thread generation counter (INCR) plays the
+    same role as in MessageCache, and WATCH/MULTI makes the generation check
+    and page appends atomic across workers. Redis errors are counted and
+    treated as misses so the cache never breaks a request.
+    """
+
+    backend_name = 'redis'
+
+    def __init__(self, client, ttl: int = 180, prefix: str = 'chat:cache:', compress_min: int = 1024):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.compress_min = compress_min
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'lookup_us_total': 0.0,
+            'lookup_us_max': 0.0,
+            'prefixes': {},
+            'invalidations': 0,
+            'invalidated_keys': 0,
+            'appends': 0,
+            'append_conflicts': 0,
+            'stale_sets_skipped': 0,
+            'errors': 0,
+            'bytes_written': 0,
+        }
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _index_key(self, thread_id: str) -> str:
+        return f"{self.prefix}thread:{thread_id}"
+
+    def _generation_key(self, thread_id: str) -> str:
+        return f"{self.prefix}gen:{thread_id}"
+
+    def _encode(self, value: Any) -> bytes:
+        data = json.dumps(value, separators=(',', ':'), default=_json_default).encode('utf-8')
+        if len(data) >= self.compress_min:
+            return b'z' + zlib.compress(data, 1)
+        return b'j' + data
+
+    @staticmethod
+    def _decode(data: bytes) -> Any:
+        if data[:1] == b'z':
+            return json.loads(zlib.decompress(data[1:]))
+        return json.loads(data[1:])
+
+    def _count(self, name: str, amount: int = 1):
         with self._lock:
-            keys_to_delete = [
-                key for key in self._cache.keys()
-                if f"thread_messages:{thread_id}:" in key
-            ]
-            for key in keys_to_delete:
-                del self._cache[key]
+            self._stats[name] += amount
+
+    def _error(self, operation: str, error: Exception):
+        self._count('errors')
+        logger.warning(f"Redis cache {operation} failed: {error}")
+
+    def get(self, key: str) -> Optional[Any]:
+        started = time.perf_counter()
+        try:
+            data = self.client.get(self._key(key))
+            value = self._decode(data) if data is not None else None
+        except Exception as e:
+            self._error('get', e)
+            value = None
+        with self._lock:
+            self._record_lookup(key, value is not None, started)
+        return value
+
+    def set(self, key: str, value: Any, thread_id: Optional[str] = None):
+        try:
+            data = self._encode(value)
+            pipe = self.client.pipeline(transaction=True)
+            pipe.set(self._key(key), data, ex=self.ttl)
+            if thread_id is not None:
+                pipe.sadd(self._index_key(thread_id), key)
+                pipe.expire(self._index_key(thread_id), self.ttl)
+            pipe.execute()
+            self._count('sets')
+            self._count('bytes_written', len(data))
+        except Exception as e:
+            self._error('set', e)
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            self._error('delete', e)
+
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(match=self.prefix + '*', count=500))
+            for i in range(0, len(keys), 500):
+                self.client.delete(*keys[i:i + 500])
+        except Exception as e:
+            self._error('clear', e)
+
+    def thread_generation(self, thread_id: str) -> int:
+        try:
+            return int(self.client.get(self._generation_key(thread_id)) or 0)
+        except Exception as e:
+            self._error('generation', e)
+            return -1
+
+    def _bump_generation(self, pipe, thread_id: str):
+        pipe.incr(self._generation_key(thread_id))
+        # Sayaç, üzerindeki sayfalardan daha uzun yaşamalı
+        pipe.expire(self._generation_key(thread_id), self.ttl * 2)
+
+    def set_thread_messages(self, thread_id: str, messages: Any, limit: int = 50,
+                            generation: Optional[int] = None):
+        if generation is not None and generation < 0:
+            return
+        key = thread_messages_key(thread_id, limit)
+        generation_key = self._generation_key(thread_id)
+        try:
+            data = self._encode(messages)
+            with self.client.pipeline(transaction=True) as pipe:
+                pipe.watch(generation_key)
+                if generation is not None and int(pipe.get(generation_key) or 0) != generation:
+                    pipe.unwatch()
+                    self._count('stale_sets_skipped')
+                    return
+                pipe.multi()
+                pipe.set(self._key(key), data, ex=self.ttl)
+                pipe.sadd(self._index_key(thread_id), key)
+                pipe.expire(self._index_key(thread_id), self.ttl)
+                pipe.execute()
+            self._count('sets')
+            self._count('bytes_written', len(data))
+        except redis.WatchError:
+            # Başka bir worker arada yazdı; eski sayfa cache'lenmez
+            self._count('stale_sets_skipped')
+        except Exception as e:
+            self._error('set_thread_messages', e)
+
+    def append_thread_message(self, thread_id: str, message: Dict[str, Any]):
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            self._bump_generation(pipe, thread_id)
+            pipe.smembers(self._index_key(thread_id))
+            keys = pipe.execute()[-1]
+            for key in keys:
+                key = key.decode() if isinstance(key, bytes) else key
+                self._append_to_key(key, message)
+            self._count('appends')
+        except Exception as e:
+            self._error('append', e)
+            self.invalidate_thread(thread_id)
+
+    def _append_to_key(self, key: str, message: Dict[str, Any]):
+        redis_key = self._key(key)
+        with self.client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(redis_key)
+                data = pipe.get(redis_key)
+                if data is None:
+                    pipe.unwatch()
+                    return
+                page = self._decode(data)
+                new_page = append_to_page(page, message, int(key.rsplit(':', 1)[1]))
+                pipe.multi()
+                if new_page is None:
+                    pipe.delete(redis_key)
+                elif new_page is not page:
+                    # Kalan TTL korunur; append sayfanın ömrünü uzatmaz
+                    pipe.set(redis_key, self._encode(new_page), keepttl=True)
+                pipe.execute()
+            except redis.WatchError:
+                # Eşzamanlı append: sayfayı düşür, sonraki okuma DB'den yükler
+                self._count('append_conflicts')
+                self.client.delete(redis_key)
+
+    def invalidate_thread(self, thread_id: str):
+        index_key = self._index_key(thread_id)
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            self._bump_generation(pipe, thread_id)
+            pipe.smembers(index_key)
+            pipe.delete(index_key)
+            keys = pipe.execute()[-2]
+            if keys:
+                self.client.delete(*[self._key(k.decode() if isinstance(k, bytes) else k) for k in keys])
+                self._count('invalidations')
+                self._count('invalidated_keys', len(keys))
+        except Exception as e:
+            self._error('invalidate', e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['prefixes'] = {name: dict(counts) for name, counts in self._stats['prefixes'].items()}
+        self._summarize_lookups(stats)
+        stats['ttl'] = self.ttl
+        stats['backend'] = self.backend_name
+        return stats
+
+def create_message_cache() -> CacheBackend:
+    """CACHE_BACKEND=redis ise paylaşımlı Redis cache, aksi halde in-process cache"""
+    if Config.CACHE_BACKEND == 'redis':
+        if redis is None:
+            logger.warning("CACHE_BACKEND=redis but the redis package is not installed; using in-process cache")
+        elif not Config.REDIS_URL:
+            logger.warning("CACHE_BACKEND=redis but REDIS_URL is not set; using in-process cache")
+        else:
+            return RedisMessageCache(redis.Redis.from_url(Config.REDIS_URL), ttl=Config.CACHE_TTL)
+    return MessageCache(ttl=Config.CACHE_TTL, max_bytes=Config.CACHE_MAX_BYTES)
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapse concurrent identical reads into one in-flight computation
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait and receive the same result (or exception).
+    Results are shared, so callers must treat them as read-only.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._stats['calls'] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats['executions'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        return stats
 
 # Global cache instance
-message_cache = MessageCache()
+message_cache = create_message_cache()
+
+# Hot read endpoint'leri için ortak single-flight grubu
+read_flight = SingleFlight()
+
+# /api/threads micro-cache'i; anahtarlar thread sync versiyonunu içerir
+thread_list_cache = MessageCache(max_size=64, ttl=Config.THREAD_LIST_CACHE_TTL,
+                                 max_bytes=Config.CACHE_MAX_BYTES // 4)
 
 def cached_thread_messages(limit: int = 50):
     """Decorator for caching thread messages"""
@@ -99,9 +791,13 @@ def cached_thread_messages(limit: int = 50):
             if cached_result is not None:
                 return cached_result
 
-            result = func(thread_id, *args, **kwargs)
-            if result:
-                message_cache.set(cache_key, result)
-            return result
+            def load():
+                result = func(thread_id, *args, **kwargs)
+                if result:
+                    message_cache.set(cache_key, result, thread_id=thread_id)
+                return result
+
+            # Aynı anda gelen miss'ler tek hesaplamayı paylaşır (stampede koruması)
+            return read_flight.do(cache_key, load)
         return wrapper
     return decorator
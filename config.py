@@ -15,7 +15,47 @@ class Config:
     
     DATABASE_URL = os.getenv('DATABASE_URL', '')
     SQLITE_PATH = 'data/chat.db'
-    
+
+    # Write-behind (group commit) kuyruğu
+    WRITE_BEHIND_FLUSH_MS = int(os.getenv('WRITE_BEHIND_FLUSH_MS', '5'))
+    WRITE_BEHIND_MAX_BATCH = int(os.getenv('WRITE_BEHIND_MAX_BATCH', '200'))
+    WRITE_BEHIND_WAIT_TIMEOUT = float(os.getenv('WRITE_BEHIND_WAIT_TIMEOUT', '5'))
+
+    # Ziyaretçi presence: heartbeat'ler bellekte tutulur, DB'ye periyodik yazılır
+    PRESENCE_FLUSH_SECONDS = float(os.getenv('PRESENCE_FLUSH_SECONDS', '10'))
+    PRESENCE_TIMEOUT_SECONDS = int(os.getenv('PRESENCE_TIMEOUT_SECONDS', '120'))
+
+    # /api/threads micro-cache TTL (saniye); 0 kapatır
+    THREAD_LIST_CACHE_TTL = float(os.getenv('THREAD_LIST_CACHE_TTL', '2'))
+
+    # Mesaj cache'inin yaklaşık bellek bütçesi (byte)
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    CACHE_TTL = int(os.getenv('CACHE_TTL', '180'))
+
+    # Mesaj cache backend'i: 'memory' (worker başına) veya 'redis' (worker'lar arası paylaşımlı)
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+    REDIS_URL = os.getenv('REDIS_URL', '')
+
+    # In-process cache'ler için worker'lar arası invalidation: auto | postgres | local
+    CACHE_INVALIDATION_BUS = os.getenv('CACHE_INVALIDATION_BUS', 'auto').lower()
+
+    # Mesaj şifreleme: ENCRYPTION_KEYS virgülle ayrılmış Fernet anahtarları (en yenisi önce);
+    # SECRET_KEY'den türetilen anahtar her zaman halkanın sonundadır. ENCRYPTION_SALT verilmezse
+    # salt DB'de (crypto_settings) saklanır.
+    ENCRYPTION_KEYS = [key.strip() for key in os.getenv('ENCRYPTION_KEYS', '').split(',') if key.strip()]
+    ENCRYPTION_SALT = os.getenv('ENCRYPTION_SALT', '')
+    # Yeni mesajların formatı: fernet | aes-gcm | chacha20-poly1305 (hepsi okunabilir)
+    ENCRYPTION_CIPHER = os.getenv('ENCRYPTION_CIPHER', 'fernet').lower()
+    # Thread başına veri anahtarı (crypto-shredding); kapalıysa mesajlar master anahtarla şifrelenir
+    ENCRYPTION_THREAD_KEYS = os.getenv('ENCRYPTION_THREAD_KEYS', 'true').lower() in ('1', 'true', 'yes')
+    # Anahtarı yok edilmiş mesaj satırlarının arka plan purge batch'i
+    SHRED_PURGE_BATCH = int(os.getenv('SHRED_PURGE_BATCH', '1000'))
+
+    # CPU-bound işler (PBKDF2, sayfa decrypt, HTML sanitize) için hub dışı thread pool:
+    # auto | eventlet | gevent | off. OFFLOAD_MIN_BYTES altındaki işler inline çalışır.
+    BLOCKING_OFFLOAD = os.getenv('BLOCKING_OFFLOAD', 'auto').lower()
+    OFFLOAD_MIN_BYTES = int(os.getenv('OFFLOAD_MIN_BYTES', '4096'))
+
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
     TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '')
     
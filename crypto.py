@@ -0,0 +1,618 @@
+import os
+import time
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from config import Config
+from database import db
+from offload import blocking_executor
+
+logger = logging.getLogger(__name__)
+
+PBKDF2_ITERATIONS = 100000
+
+# crypto_settings satırı: SECRET_KEY'den anahtar türetmekte kullanılan salt
+SALT_SETTING = 'kdf_salt'
+
+# Saklama formatları messages.content_text'in önekinden tanınır:
+# Fernet token'ı (versiyon byte'ı 0x80) base64url'de 'gAAAAA' ile başlar;
+# eski format aynı token'ı bir kez daha base64'lediği için 'Z0FBQUFB' ile başlar.
+# AEAD zarfları base64url(versiyon byte'ı | nonce | ciphertext+tag) şeklindedir.
+FERNET_PREFIX = 'gAAAAA'
+LEGACY_PREFIX = 'Z0FBQUFB'
+FERNET_VERSION = 0x80
+
+# Thread anahtarı zarfı: 0x10 | epoch (4 byte) | nonce | ciphertext+tag (AES-GCM);
+# thread_id associated data'dır, zarf başka bir thread'e taşınamaz
+THREAD_KEY_VERSION = 0x10
+THREAD_KEY_CACHE_SIZE = 4096
+
+def parse_stored(stored: str) -> Tuple[int, bytes]:
+    """Saklanan metinden (versiyon, veri); Fernet için veri token'ın kendisidir"""
+    if stored.startswith(LEGACY_PREFIX):
+        return FERNET_VERSION, base64.urlsafe_b64decode(stored)
+    if stored.startswith(FERNET_PREFIX):
+        return FERNET_VERSION, stored.encode('ascii')
+    envelope = base64.urlsafe_b64decode(stored)
+    if not envelope:
+        raise InvalidToken
+    return envelope[0], envelope
+
+def is_legacy(stored: Optional[str]) -> bool:
+    return bool(stored) and stored.startswith(LEGACY_PREFIX)
+
+def derive_key(password: str, salt: bytes) -> bytes:
+    """PBKDF2-SHA256 ile parola + salt'tan Fernet anahtarı türet
+
+    hashlib hesap sırasında GIL'i bırakır (cryptography'nin PBKDF2HMAC'i
+    bırakmaz), böylece thread pool'da çalışırken hub bloklanmaz. Çıktı aynıdır.
+    """
+    return base64.urlsafe_b64encode(
+        hashlib.pbkdf2_hmac('sha256', password.encode(), salt, PBKDF2_ITERATIONS, 32)
+    )
+
+def derive_aead_key(fernet_key: bytes) -> bytes:
+    """Fernet anahtarından (HKDF ile) 32 byte'lık AEAD anahtarı"""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'chat-message-aead')
+    return hkdf.derive(base64.urlsafe_b64decode(fernet_key))
+
+class AEADCipher:
+    """Versioned AEAD envelope: version byte | 12-byte nonce | ciphertext+tag
+
+    The version byte is authenticated as associated data. Encryption uses
+    the first key; decryption tries the keys newest first, like MultiFernet.
+    """
+
+    NONCE_SIZE = 12
+
+    def __init__(self, version: int, algorithm, keys: List[bytes]):
+        self.version = version
+        self.header = bytes([version])
+        self._aeads = [algorithm(key) for key in keys]
+
+    def encrypt(self, data: bytes) -> bytes:
+        nonce = os.urandom(self.NONCE_SIZE)
+        return self.header + nonce + self._aeads[0].encrypt(nonce, data, self.header)
+
+    def decrypt(self, envelope: bytes, primary_only: bool = False) -> bytes:
+        nonce = envelope[1:1 + self.NONCE_SIZE]
+        ciphertext = envelope[1 + self.NONCE_SIZE:]
+        for aead in self._aeads[:1] if primary_only else self._aeads:
+            try:
+                return aead.decrypt(nonce, ciphertext, self.header)
+            except InvalidTag:
+                continue
+        raise InvalidToken
+
+# ENCRYPTION_CIPHER değerleri -> (versiyon byte'ı, cryptography AEAD sınıfı)
+AEAD_CIPHERS = {
+    'aes-gcm': (0x01, AESGCM),
+    'chacha20-poly1305': (0x02, ChaCha20Poly1305),
+}
+
+class CryptoService:
+    """Message encryption with a persistent salt and a pluggable cipher
+
+    The key ring is built once per process, on first use: keys listed in
+    ENCRYPTION_KEYS (newest first) followed by the key derived from
+    SECRET_KEY with the salt stored in crypto_settings, so every worker and
+    every boot derives the same key. New messages are encrypted with the
+    first key; any key in the ring decrypts. reencrypt_messages() moves old
+    tokens to the first key and the configured cipher in batches, in a
+    background thread if started with start_reencryption().
+
+    ENCRYPTION_CIPHER selects the write format: 'fernet' (single-encoded
+    token) or an AEAD envelope ('aes-gcm', 'chacha20-poly1305') whose first
+    byte names the cipher. Every format, including the old double-base64
+    Fernet rows, stays readable; convert_legacy_messages() rewrites the
+    double-base64 rows without decrypting.
+
+    With thread keys, each (thread, epoch) gets a random AES-GCM data key
+    stored in thread_keys wrapped by the master ring. Clearing a thread
+    destroys the epoch's key and moves the thread to the next epoch, so the
+    old messages are unreadable at once however many there are; the rows
+    are purged later in the background (crypto-shredding).
+    """
+
+    def __init__(self, database, password: str, keys: Optional[List[str]] = None,
+                 cipher: str = 'fernet', salt: Optional[bytes] = None, thread_keys: bool = False):
+        self.db = database
+        self.password = password
+        self.keys = keys or []
+        if cipher != 'fernet' and cipher not in AEAD_CIPHERS:
+            logger.warning(f"Unknown ENCRYPTION_CIPHER {cipher!r}; using fernet")
+            cipher = 'fernet'
+        self.cipher = cipher
+        self.salt = salt
+        self.thread_keys = thread_keys
+        self._thread_ciphers: "OrderedDict[Tuple[str, int], AESGCM]" = OrderedDict()  # (thread_id, epoch) -> AEAD
+        self._current_epochs: "OrderedDict[str, int]" = OrderedDict()  # thread_id -> yazma epoch'u
+        self._keys_lock = threading.Lock()
+        self._bus = None
+        self._purge_event = threading.Event()
+        self._purge_thread: Optional[threading.Thread] = None
+        self._primary: Optional[Fernet] = None
+        self._ring: Optional[MultiFernet] = None
+        self._aead: Dict[int, AEADCipher] = {}
+        self._writer: Optional[AEADCipher] = None
+        self._lock = threading.Lock()
+        self._reencrypt_thread: Optional[threading.Thread] = None
+        self._stats = {
+            'encrypted': 0,
+            'decrypted': 0,
+            'decrypt_errors': 0,
+            'key_ring_ms': 0.0,
+            'reencryption': {'running': False, 'scanned': 0, 'rotated': 0, 'failed': 0, 'rewrapped_keys': 0},
+            'thread_keys_created': 0,
+            'thread_keys_loaded': 0,
+            'threads_shredded': 0,
+            'purged_messages': 0,
+        }
+
+    def _load_salt(self) -> bytes:
+        """ENCRYPTION_SALT (base64) veya DB'de kalıcı salt; ilk açılışta üretilir"""
+        if self.salt is not None:
+            return self.salt
+        if Config.ENCRYPTION_SALT:
+            return base64.urlsafe_b64decode(Config.ENCRYPTION_SALT)
+        # Aynı anda açılan worker'lardan yalnızca birinin salt'ı yazılır; hepsi onu okur
+        self.db.execute_query(
+            'INSERT INTO crypto_settings (name, value) VALUES (?, ?) ON CONFLICT (name) DO NOTHING',
+            (SALT_SETTING, base64.urlsafe_b64encode(os.urandom(16)).decode()),
+            fetch=None
+        )
+        row = self.db.execute_query(
+            'SELECT value FROM crypto_settings WHERE name = ?', (SALT_SETTING,), fetch='one'
+        )
+        return base64.urlsafe_b64decode(row['value'])
+
+    def _key_ring(self) -> MultiFernet:
+        ring = self._ring
+        if ring is not None:
+            return ring
+        with self._lock:
+            if self._ring is None:
+                started = time.perf_counter()
+                fernet_keys = [key.encode() for key in self.keys]
+                # PBKDF2 ~100 ms CPU: hub'ı bloklamasın (salt okuması hub'da kalır)
+                fernet_keys.append(blocking_executor.run(derive_key, self.password, self._load_salt()))
+                fernets = [Fernet(key) for key in fernet_keys]
+                # Her AEAD okunabilsin diye hepsi kurulur; yazma yalnızca seçili cipher ile
+                aead_keys = [derive_aead_key(key) for key in fernet_keys]
+                self._aead = {
+                    version: AEADCipher(version, algorithm, aead_keys)
+                    for version, algorithm in AEAD_CIPHERS.values()
+                }
+                if self.cipher != 'fernet':
+                    self._writer = self._aead[AEAD_CIPHERS[self.cipher][0]]
+                self._primary = fernets[0]
+                self._ring = MultiFernet(fernets)
+                self._stats['key_ring_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                logger.info(f"Encryption key ring ready: {len(fernets)} key(s), cipher {self.cipher}")
+            return self._ring
+
+    def _encrypt(self, data: bytes) -> str:
+        ring = self._key_ring()
+        if self._writer is None:
+            return ring.encrypt(data).decode('ascii')
+        return base64.urlsafe_b64encode(self._writer.encrypt(data)).decode('ascii')
+
+    def _decrypt(self, version: int, data: bytes, primary_only: bool = False,
+                 thread_id: Optional[str] = None) -> bytes:
+        ring = self._key_ring()
+        if version == FERNET_VERSION:
+            return self._primary.decrypt(data) if primary_only else ring.decrypt(data)
+        if version == THREAD_KEY_VERSION:
+            return self._decrypt_thread(data, thread_id)
+        engine = self._aead.get(version)
+        if engine is None:
+            raise InvalidToken
+        return engine.decrypt(data, primary_only)
+
+    def encrypt(self, text: str, thread_id: Optional[str] = None) -> str:
+        return self.encrypt_with_epoch(text, thread_id)[0]
+
+    def encrypt_with_epoch(self, text: str, thread_id: Optional[str] = None) -> Tuple[str, Optional[int]]:
+        """(token, mühürlendiği thread epoch'u); thread anahtarı kullanılmadıysa epoch None
+
+        Mesaj satırının key_epoch'u bu epoch olmalı: flush'tan önce gelen bir
+        clear sonrası satır yeni epoch'a düşerse görünür ama çözülemez olur.
+        """
+        data = text.encode()
+        epoch = None
+        # Anahtar hazırlığı (DB okuyabilir) çağıranda, şifreleme büyük metinde thread pool'da
+        if self.thread_keys and thread_id:
+            epoch, aead = self._thread_cipher(thread_id)
+            token = blocking_executor.run(self._seal_thread, data, thread_id, epoch, aead, size=len(data))
+        else:
+            self._key_ring()
+            token = blocking_executor.run(self._encrypt, data, size=len(data))
+        self._stats['encrypted'] += 1
+        return token, epoch
+
+    def decrypt(self, encrypted_text: str, thread_id: Optional[str] = None) -> str:
+        try:
+            text = self._decrypt(*parse_stored(encrypted_text), thread_id=thread_id).decode()
+        except Exception:
+            self._stats['decrypt_errors'] += 1
+            raise
+        self._stats['decrypted'] += 1
+        return text
+
+    def decrypt_many(self, items: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+        """[(şifreli metin, thread_id)] -> düz metinler; çözülemeyenler None
+
+        Anahtarlar (DB okuması gerekebilir) çağıranda hazırlanır; sayfanın
+        tamamı tek iş olarak hub dışında çözülür.
+        """
+        self._key_ring()
+        parsed = []
+        thread_aeads: Dict[Tuple[str, int], Optional[AESGCM]] = {}
+        size = 0
+        for encrypted_text, thread_id in items:
+            try:
+                version, data = parse_stored(encrypted_text)
+            except Exception:
+                parsed.append(None)
+                continue
+            if version == THREAD_KEY_VERSION and thread_id:
+                cache_key = (thread_id, int.from_bytes(data[1:5], 'big'))
+                if cache_key not in thread_aeads:
+                    try:
+                        thread_aeads[cache_key] = self._thread_cipher(*cache_key)[1]
+                    except InvalidToken:
+                        thread_aeads[cache_key] = None
+            parsed.append((version, data, thread_id))
+            size += len(data)
+        texts = blocking_executor.run(self._open_many, parsed, thread_aeads, size=size)
+        failed = texts.count(None)
+        self._stats['decrypted'] += len(texts) - failed
+        self._stats['decrypt_errors'] += failed
+        return texts
+
+    def _open_many(self, parsed: List[Optional[Tuple[int, bytes, Optional[str]]]],
+                   thread_aeads: Dict[Tuple[str, int], Optional[AESGCM]]) -> List[Optional[str]]:
+        """decrypt_many'nin saf CPU kısmı: DB'ye dokunmaz"""
+        texts = []
+        for item in parsed:
+            try:
+                version, data, thread_id = item
+                if version == THREAD_KEY_VERSION:
+                    aead = thread_aeads.get((thread_id, int.from_bytes(data[1:5], 'big')))
+                    plain = self._open_thread(data, thread_id, aead)
+                else:
+                    plain = self._decrypt(version, data)
+                texts.append(plain.decode())
+            except Exception:
+                texts.append(None)
+        return texts
+
+    def _rotate(self, encrypted_text: str) -> Optional[str]:
+        """Token ilk anahtar + seçili cipher ile değilse yeniden şifrelenmiş hali, değilse None
+
+        Thread anahtarlı zarflar atlanır; onların anahtarları yeniden sarılır.
+        """
+        self._key_ring()
+        version, data = parse_stored(encrypted_text)
+        if version == THREAD_KEY_VERSION:
+            return None
+        target = self._writer.version if self._writer is not None else FERNET_VERSION
+        if version == target:
+            try:
+                self._decrypt(version, data, primary_only=True)
+                return None
+            except InvalidToken:
+                pass
+        return self._encrypt(self._decrypt(version, data))
+
+    def _rotate_many(self, texts: List[str]) -> Tuple[List[Optional[str]], int]:
+        """Batch'i hub dışında döndür: (yeni token ya da None listesi, başarısız sayısı)"""
+        self._key_ring()
+
+        def rotate_all():
+            rotated, failed = [], 0
+            for text in texts:
+                try:
+                    rotated.append(self._rotate(text))
+                except Exception:
+                    rotated.append(None)
+                    failed += 1
+            return rotated, failed
+
+        return blocking_executor.run(rotate_all, size=sum(len(text) for text in texts))
+
+    def _seal_thread(self, data: bytes, thread_id: str, epoch: int, aead: AESGCM) -> str:
+        header = bytes([THREAD_KEY_VERSION]) + epoch.to_bytes(4, 'big')
+        nonce = os.urandom(AEADCipher.NONCE_SIZE)
+        envelope = header + nonce + aead.encrypt(nonce, data, header + thread_id.encode())
+        return base64.urlsafe_b64encode(envelope).decode('ascii')
+
+    def _decrypt_thread(self, envelope: bytes, thread_id: Optional[str]) -> bytes:
+        if not thread_id:
+            raise InvalidToken
+        _, aead = self._thread_cipher(thread_id, int.from_bytes(envelope[1:5], 'big'))
+        return self._open_thread(envelope, thread_id, aead)
+
+    def _open_thread(self, envelope: bytes, thread_id: Optional[str], aead: Optional[AESGCM]) -> bytes:
+        if not thread_id or aead is None:
+            raise InvalidToken
+        header = envelope[:5]
+        nonce = envelope[5:5 + AEADCipher.NONCE_SIZE]
+        try:
+            return aead.decrypt(nonce, envelope[5 + AEADCipher.NONCE_SIZE:], header + thread_id.encode())
+        except InvalidTag:
+            raise InvalidToken
+
+    def _thread_cipher(self, thread_id: str, epoch: Optional[int] = None) -> Tuple[int, AESGCM]:
+        """(epoch, AEAD) for a thread key; epoch=None means the thread's write epoch
+
+        Write keys are created on first use. A destroyed (shredded) or
+        missing key raises InvalidToken.
+        """
+        with self._keys_lock:
+            current = epoch if epoch is not None else self._current_epochs.get(thread_id)
+            if current is not None:
+                aead = self._thread_ciphers.get((thread_id, current))
+                if aead is not None:
+                    self._thread_ciphers.move_to_end((thread_id, current))
+                    return current, aead
+
+        # İki deneme: anahtar oluşturulurken epoch başka bir worker'da shred edilmiş olabilir
+        for _ in range(2):
+            target = epoch
+            if target is None:
+                row = self.db.execute_query('SELECT key_epoch FROM threads WHERE id = ?', (thread_id,), fetch='one')
+                if row is None:
+                    raise InvalidToken
+                target = row['key_epoch']
+            wrapped = self._load_thread_key(thread_id, target, create=epoch is None)
+            if wrapped is not None:
+                break
+            if epoch is not None:
+                raise InvalidToken
+        else:
+            raise InvalidToken
+
+        aead = AESGCM(self._decrypt(*parse_stored(wrapped)))
+        with self._keys_lock:
+            self._thread_ciphers[(thread_id, target)] = aead
+            if len(self._thread_ciphers) > THREAD_KEY_CACHE_SIZE:
+                self._thread_ciphers.popitem(last=False)
+            if epoch is None:
+                self._current_epochs[thread_id] = target
+                self._current_epochs.move_to_end(thread_id)
+                if len(self._current_epochs) > THREAD_KEY_CACHE_SIZE:
+                    self._current_epochs.popitem(last=False)
+        return target, aead
+
+    def _load_thread_key(self, thread_id: str, epoch: int, create: bool) -> Optional[str]:
+        """Sarılı anahtar; yoksa (create ile) üretilir, yok edilmişse None"""
+        query = 'SELECT wrapped_key FROM thread_keys WHERE thread_id = ? AND epoch = ?'
+        row = self.db.execute_query(query, (thread_id, epoch), fetch='one')
+        if row is None and create:
+            # Aynı anda ilk mesajı yazan worker'lardan yalnızca birinin anahtarı kalır
+            self.db.execute_query(
+                'INSERT INTO thread_keys (thread_id, epoch, wrapped_key) VALUES (?, ?, ?) '
+                'ON CONFLICT (thread_id, epoch) DO NOTHING',
+                (thread_id, epoch, self._encrypt(AESGCM.generate_key(bit_length=256))),
+                fetch=None
+            )
+            self._stats['thread_keys_created'] += 1
+            row = self.db.execute_query(query, (thread_id, epoch), fetch='one')
+        if row is None or row['wrapped_key'] is None:
+            return None
+        self._stats['thread_keys_loaded'] += 1
+        return row['wrapped_key']
+
+    def attach_bus(self, bus):
+        """Shred edilen thread anahtarlarını diğer worker'ların cache'inden de düşür"""
+        self._bus = bus
+        bus.subscribe(self._on_remote_invalidation)
+
+    def _on_remote_invalidation(self, kind: str, key: str):
+        if kind == 'thread_keys.thread':
+            self._forget_local(key)
+        elif kind == 'thread_keys.clear':
+            self._forget_local(None)
+
+    def _forget_local(self, thread_id: Optional[str]):
+        with self._keys_lock:
+            if thread_id is None:
+                self._thread_ciphers.clear()
+                self._current_epochs.clear()
+                return
+            self._current_epochs.pop(thread_id, None)
+            for cache_key in [k for k in self._thread_ciphers if k[0] == thread_id]:
+                del self._thread_ciphers[cache_key]
+
+    def thread_shredded(self, thread_id: Optional[str] = None):
+        """Thread (None: tüm thread'ler) temizlendikten sonra çağrılır
+
+        Cache'teki anahtarlar her worker'da düşürülür ve arka plan purge'ü
+        uyandırılır.
+        """
+        self._forget_local(thread_id)
+        if self._bus is not None:
+            if thread_id is None:
+                self._bus.publish('thread_keys.clear')
+            else:
+                self._bus.publish('thread_keys.thread', thread_id)
+        self._stats['threads_shredded'] += 1
+        self.schedule_purge()
+
+    def schedule_purge(self):
+        """Anahtarı yok edilmiş satırların silinmesini arka planda başlat"""
+        self._purge_event.set()
+        with self._lock:
+            if self._purge_thread is None or not self._purge_thread.is_alive():
+                self._purge_thread = threading.Thread(target=self._purge_loop, name='shred-purge', daemon=True)
+                self._purge_thread.start()
+
+    def _purge_loop(self):
+        while True:
+            self._purge_event.wait()
+            self._purge_event.clear()
+            try:
+                purged = self.db.purge_shredded_messages(Config.SHRED_PURGE_BATCH)
+                self._stats['purged_messages'] += purged
+                if purged:
+                    logger.info(f"Purged {purged} shredded messages")
+            except Exception as e:
+                logger.error(f"Shredded message purge failed: {e}")
+
+    def reencrypt_messages(self, batch_size: int = 500, pause: float = 0.05) -> Dict[str, int]:
+        """Eski anahtarla şifreli metin mesajlarını ilk anahtara taşı
+
+        Mesajlar id sırasıyla batch'ler halinde okunur; her batch tek
+        transaction'da güncellenir. UPDATE eski token'ı da eşlediği için
+        aynı anda çalışan başka bir worker'ın yazdığı satır ezilmez. Thread
+        anahtarlı mesajlara dokunulmaz; önce thread anahtarları yeniden sarılır.
+        """
+        progress = self._stats['reencryption']
+        progress['rewrapped_keys'] = self._rewrap_thread_keys(batch_size)
+        last_id = ''
+        while True:
+            batch = self.db.execute_query(
+                "SELECT id, content_text FROM messages WHERE type = 'text' AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            if not batch:
+                break
+            last_id = batch[-1]['id']
+            rows = [row for row in batch if row['content_text']]
+            rotated, failed = self._rotate_many([row['content_text'] for row in rows])
+            progress['failed'] += failed
+            updates = [
+                (token, row['id'], row['content_text'])
+                for row, token in zip(rows, rotated) if token is not None
+            ]
+            if updates:
+                with self.db.get_connection() as conn:
+                    cursor = conn.cursor()
+                    self.db.executemany(
+                        cursor, 'UPDATE messages SET content_text = ? WHERE id = ? AND content_text = ?', updates
+                    )
+                    conn.commit()
+            progress['scanned'] += len(batch)
+            progress['rotated'] += len(updates)
+            if pause:
+                # Canlı trafiğe yer bırak
+                time.sleep(pause)
+        return {key: progress[key] for key in ('scanned', 'rotated', 'failed', 'rewrapped_keys')}
+
+    def _rewrap_thread_keys(self, batch_size: int) -> int:
+        """thread_keys'teki sarılı anahtarları master halkanın ilk anahtarına taşı"""
+        rewrapped = 0
+        last = ('', -1)
+        while True:
+            batch = self.db.execute_query(
+                'SELECT thread_id, epoch, wrapped_key FROM thread_keys '
+                'WHERE wrapped_key IS NOT NULL AND (thread_id, epoch) > (?, ?) ORDER BY thread_id, epoch LIMIT ?',
+                (last[0], last[1], batch_size)
+            )
+            if not batch:
+                return rewrapped
+            last = (batch[-1]['thread_id'], batch[-1]['epoch'])
+            rotated, _ = self._rotate_many([row['wrapped_key'] for row in batch])
+            updates = [
+                (token, row['thread_id'], row['epoch'], row['wrapped_key'])
+                for row, token in zip(batch, rotated) if token is not None
+            ]
+            if updates:
+                with self.db.get_connection() as conn:
+                    cursor = conn.cursor()
+                    self.db.executemany(
+                        cursor,
+                        'UPDATE thread_keys SET wrapped_key = ? WHERE thread_id = ? AND epoch = ? AND wrapped_key = ?',
+                        updates
+                    )
+                    conn.commit()
+                rewrapped += len(updates)
+
+    def convert_legacy_messages(self, batch_size: int = 1000, pause: float = 0.05,
+                                progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+        """Çift base64'lü eski satırları tek kodlu token'a çevir (şifre çözmeden)
+
+        id sırasıyla batch'ler halinde ilerler, her batch ayrı transaction'dır;
+        uygulama çalışırken güvenle çalıştırılabilir. Okuyucular iki formatı
+        da kabul ettiği için yarıda kesilirse kaldığı yerden devam edilebilir.
+        """
+        result = {'scanned': 0, 'converted': 0, 'bytes_saved': 0}
+        last_id = ''
+        while True:
+            # Yalnızca eski formattaki satırlar okunur
+            batch = self.db.execute_query(
+                "SELECT id, content_text FROM messages WHERE type = 'text' AND id > ? AND content_text LIKE ? "
+                "ORDER BY id LIMIT ?",
+                (last_id, LEGACY_PREFIX + '%', batch_size)
+            )
+            if not batch:
+                break
+            last_id = batch[-1]['id']
+            updates = []
+            for row in batch:
+                stored = row['content_text']
+                if is_legacy(stored):
+                    token = parse_stored(stored)[1].decode('ascii')
+                    updates.append((token, row['id'], stored))
+                    result['bytes_saved'] += len(stored) - len(token)
+            if updates:
+                with self.db.get_connection() as conn:
+                    cursor = conn.cursor()
+                    self.db.executemany(
+                        cursor, 'UPDATE messages SET content_text = ? WHERE id = ? AND content_text = ?', updates
+                    )
+                    conn.commit()
+            result['scanned'] += len(batch)
+            result['converted'] += len(updates)
+            if progress:
+                progress(result)
+            if pause:
+                time.sleep(pause)
+        return result
+
+    def start_reencryption(self, batch_size: int = 500) -> bool:
+        """reencrypt_messages'ı arka planda başlat; zaten çalışıyorsa False"""
+        with self._lock:
+            if self._reencrypt_thread is not None and self._reencrypt_thread.is_alive():
+                return False
+            self._stats['reencryption'] = {'running': True, 'scanned': 0, 'rotated': 0, 'failed': 0, 'rewrapped_keys': 0}
+            self._reencrypt_thread = threading.Thread(
+                target=self._run_reencryption, args=(batch_size,), name='reencrypt-messages', daemon=True
+            )
+            self._reencrypt_thread.start()
+            return True
+
+    def _run_reencryption(self, batch_size: int):
+        progress = self._stats['reencryption']
+        try:
+            result = self.reencrypt_messages(batch_size)
+            logger.info(f"Message re-encryption finished: {result}")
+        except Exception as e:
+            logger.error(f"Message re-encryption failed: {e}")
+        finally:
+            progress['running'] = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['reencryption'] = dict(self._stats['reencryption'])
+        stats['keys'] = len(self.keys) + 1
+        stats['cipher'] = self.cipher
+        stats['ready'] = self._ring is not None
+        stats['thread_keys'] = self.thread_keys
+        stats['cached_thread_keys'] = len(self._thread_ciphers)
+        return stats
+
+# Global crypto service
+crypto = CryptoService(db, Config.SECRET_KEY, Config.ENCRYPTION_KEYS, Config.ENCRYPTION_CIPHER,
+                       thread_keys=Config.ENCRYPTION_THREAD_KEYS)
@@ -1,4 +1,11 @@
 import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import base64
+import binascii
 import sqlite3
 import threading
 from contextlib import contextmanager
@@ -15,6 +22,356 @@ try:
 except ImportError:
     psycopg2 = None
 
+# Write-behind kuyruğunun yazabildiği tablolar ve INSERT şablonları
+WRITE_BEHIND_STATEMENTS = {
+    # key_epoch metnin mühürlendiği epoch; thread anahtarıyla şifrelenmemiş
+    # satırlarda (NULL) commit anındaki thread epoch'u
+    'messages': (
+        'INSERT INTO messages (id, thread_id, sender, type, content_text, file_path, created_at, key_epoch) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, (SELECT key_epoch FROM threads WHERE id = ?), 0))'
+    ),
+    'telegram_links': 'INSERT INTO telegram_links (thread_id, tg_chat_id, tg_message_id) VALUES (?, ?, ?)',
+    'telegram_inbound': (
+        'INSERT INTO telegram_inbound (tg_chat_id, tg_message_id) VALUES (?, ?) '
+        'ON CONFLICT (tg_chat_id, tg_message_id) DO NOTHING'
+    ),
+}
+
+# Her mesaj flush'ında threads özet kolonlarını güncelleyen statement.
+# Admin cevabı okunmamış sayacını sıfırlar, ziyaretçi mesajları arttırır.
+# Arada temizlenmiş (eski epoch'ta mühürlenmiş) mesajlar özete yansımaz.
+THREAD_SUMMARY_UPDATE = (
+    'UPDATE threads SET message_count = message_count + ?, last_message_at = ?, '
+    'last_message_preview = ?, last_sender = ?, '
+    'unread_count = CASE WHEN ? THEN 0 ELSE unread_count END + ?, version = ? '
+    'WHERE id = ? AND key_epoch = COALESCE(?, key_epoch)'
+)
+
+# Purge bittikten sonra yazılan eski epoch satırları için purge işaretini geri koy
+SHREDDED_EPOCH_MARKER = (
+    'INSERT INTO thread_keys (thread_id, epoch, wrapped_key) '
+    'SELECT id, ?, NULL FROM threads WHERE id = ? AND key_epoch > ? '
+    'ON CONFLICT (thread_id, epoch) DO NOTHING'
+)
+
+# thread_updated patch'inde admin istemcisine giden kolonlar
+THREAD_PATCH_COLUMNS = (
+    'id, last_message_at, last_message_preview, last_sender, message_count, '
+    'unread_count, last_activity_at, version'
+)
+
+# Thread'in güncel anahtar epoch'undaki mesajlar; temizlenen (shred edilen) epoch'lar görünmez
+VISIBLE_EPOCH = 'key_epoch = (SELECT key_epoch FROM threads WHERE id = ?)'
+
+# Tümü silinen thread'ler mesajları purge edilene kadar tombstone'lu satır olarak kalır
+LIVE_THREAD = 'NOT EXISTS (SELECT 1 FROM thread_tombstones WHERE thread_id = threads.id)'
+
+# Bu epoch'taki purge işareti thread'in tüm mesajlarını ve en sonda thread satırını siler
+DELETED_THREAD_EPOCH = -1
+
+# Thread listesi değişiklik sayacı; satır kilidi sayesinde versiyonlar commit sırasıyla artar
+NEXT_THREADS_VERSION = "UPDATE sync_counters SET value = value + 1 WHERE name = 'threads' RETURNING value"
+
+# messages tablosunun kolonları (MessageRecord slot'ları ile aynı sırada)
+MESSAGE_COLUMNS = ('id', 'thread_id', 'sender', 'type', 'content_text', 'file_path', 'created_at')
+MESSAGE_SELECT = ', '.join(MESSAGE_COLUMNS)
+
+class MessageRecord:
+    """Compact message row used by page reads and the message cache
+
+    A __slots__ object has no per-instance dict, so a cached message costs
+    one small object instead of a dict with a hash table. sender and type
+    are interned: every row shares the same few string objects. Supports
+    dict-style access (msg['id'], msg.get(...)) so handlers can use it like
+    a row; to_dict() builds the wire dict at the serialization boundary.
+    """
+
+    __slots__ = MESSAGE_COLUMNS
+
+    def __init__(self, id, thread_id, sender, type, content_text, file_path, created_at):
+        self.id = id
+        self.thread_id = thread_id
+        self.sender = sys.intern(sender) if isinstance(sender, str) else sender
+        self.type = sys.intern(type) if isinstance(type, str) else type
+        self.content_text = content_text
+        self.file_path = file_path
+        self.created_at = created_at
+
+    @classmethod
+    def from_row(cls, row):
+        """dict satırından (veya zaten record ise aynen) MessageRecord"""
+        if isinstance(row, cls):
+            return row
+        return cls(*(row.get(column) for column in MESSAGE_COLUMNS))
+
+    def __getitem__(self, name):
+        if name not in MESSAGE_COLUMNS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        if name not in MESSAGE_COLUMNS:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in MESSAGE_COLUMNS else default
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in MESSAGE_COLUMNS}
+
+    def __repr__(self):
+        return f'MessageRecord(id={self.id!r}, thread_id={self.thread_id!r}, sender={self.sender!r})'
+
+MEDIA_PREVIEW = 'Medya mesajı'
+UNREADABLE_PREVIEW = '[Şifrelenmiş mesaj okunamıyor]'
+
+def build_message_preview(content_text, limit=50):
+    """Admin thread listesi/bildirimleri için kısa düz metin önizleme"""
+    if not content_text:
+        return MEDIA_PREVIEW
+    return content_text[:limit] + ('...' if len(content_text) > limit else '')
+
+def encode_cursor(message):
+    """(created_at, id) çiftini opak, URL-safe bir cursor'a çevir"""
+    raw = json.dumps([str(message['created_at']), message['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """encode_cursor tersine çevirir; bozuk cursor için ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, msg_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(created_at, str) or not isinstance(msg_id, str):
+        raise ValueError('Invalid cursor')
+    return created_at, msg_id
+
+class MessageClock:
+    """Yeni mesajların (created_at, id) çifti; process içinde kesin artan
+
+    created_at mikrosaniye hassasiyetlidir; aynı mikrosaniyede ya da saat geri
+    alındığında bir öncekinin 1 µs sonrası kullanılır. id aynı anı taşıyan
+    bir UUIDv7'dir (48 bit ms | versiyon | 12 bit ms içi µs | rastgele), bu
+    yüzden (created_at, id) keyset sırası ekleme sırasıyla aynıdır. Farklı
+    worker'ların aynı mikrosaniyedeki mesajları id ile kararlı sıralanır.
+    """
+
+    EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    def __init__(self, tz):
+        self.tz = tz
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            micros = max(time.time_ns() // 1000, self._last + 1)
+            self._last = micros
+        created_at = (self.EPOCH + timedelta(microseconds=micros)).astimezone(self.tz)
+        millis, sub_millis = divmod(micros, 1000)
+        value = (
+            (millis & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | sub_millis << 64
+            | 0b10 << 62 | int.from_bytes(os.urandom(8), 'big') >> 2
+        )
+        return created_at.strftime('%Y-%m-%d %H:%M:%S.%f'), str(uuid.UUID(int=value))
+
+class PendingWrite:
+    """Kuyruğa alınmış tek bir satır; wait() ile kalıcı olması beklenebilir"""
+
+    __slots__ = ('table', 'params', 'summary', 'error', '_done')
+
+    def __init__(self, table, params, summary=None):
+        self.table = table
+        self.params = params
+        self.summary = summary  # (thread_id, created_at, preview, sender, key_epoch) - sadece messages
+        self.error = None
+        self._done = threading.Event()
+
+    def resolve(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Satır commit edilene kadar bekle, yazılamadıysa hatayı yükselt"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'{self.table} write not flushed within {timeout}s')
+        if self.error is not None:
+            raise self.error
+
+class WriteBehindQueue:
+    """Group-commit writer - bekleyen satırları tek transaction'da executemany ile yazar"""
+
+    def __init__(self, database, flush_interval=0.005, max_batch=200):
+        self.db = database
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self._stats = {
+            'flushes': 0,
+            'rows_written': 0,
+            'failed_rows': 0,
+            'max_queue_depth': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+            'listener_errors': 0,
+            'last_listener_error': None,
+        }
+        atexit.register(self.flush)
+
+    def submit(self, table, params, summary=None):
+        """Satırı kuyruğa ekle ve PendingWrite döndür"""
+        if table not in WRITE_BEHIND_STATEMENTS:
+            raise ValueError(f'Unsupported write-behind table: {table}')
+        pending = PendingWrite(table, tuple(params), summary)
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append(pending)
+            depth = len(self._pending)
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+            # Boş kuyruğa ilk satır writer'ı uyandırır, dolu batch beklemeyi keser
+            if depth == 1 or depth >= self.max_batch:
+                self._cond.notify()
+        return pending
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # İlk satır geldikten sonra batch'in dolması için kısa süre bekle
+                if len(self._pending) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Kuyruktaki satırları hemen yaz (atexit ve testler için de kullanılır)"""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.max_batch]
+                    del self._pending[:self.max_batch]
+                if not batch:
+                    return
+                self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        failed = 0
+        try:
+            self._write_rows(batch)
+            for pending in batch:
+                pending.resolve()
+        except Exception:
+            # Batch'i bozan satırı izole etmek için tek tek yaz
+            for pending in batch:
+                try:
+                    self._write_rows([pending])
+                    pending.resolve()
+                except Exception as e:
+                    failed += 1
+                    pending.resolve(e)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats = self._stats
+        stats['flushes'] += 1
+        stats['rows_written'] += len(batch) - failed
+        stats['failed_rows'] += failed
+        stats['last_batch_size'] = len(batch)
+        stats['last_flush_ms'] = round(elapsed_ms, 3)
+        stats['max_flush_ms'] = max(stats['max_flush_ms'], round(elapsed_ms, 3))
+        stats['total_flush_ms'] += elapsed_ms
+
+    def _write_rows(self, rows):
+        """Satırları ve etkilenen thread özetlerini tek transaction'da yaz"""
+        by_table = {}
+        summaries = {}
+        for pending in rows:
+            by_table.setdefault(pending.table, []).append(pending.params)
+            if pending.summary:
+                thread_id, created_at, preview, sender, key_epoch = pending.summary
+                summary = summaries.get((thread_id, key_epoch))
+                if summary is None:
+                    # [count, last_message_at, preview, sender, reset_unread, unread, version, id, key_epoch]
+                    summary = summaries[thread_id, key_epoch] = [0, None, None, None, False, 0, None, thread_id, key_epoch]
+                summary[0] += 1
+                summary[1:4] = created_at, preview, sender
+                if sender == 'visitor':
+                    summary[5] += 1
+                else:
+                    summary[4], summary[5] = True, 0
+
+        changed = []
+        with self.db.get_connection() as conn:
+            try:
+                cursor = conn.cursor()
+                for table, params in by_table.items():
+                    self.db.executemany(cursor, WRITE_BEHIND_STATEMENTS[table], params)
+                if summaries:
+                    # Flush'taki tüm thread değişiklikleri tek versiyonu paylaşır
+                    version = self.db.next_threads_version(cursor)
+                    for summary in summaries.values():
+                        summary[6] = version
+                    # Sabit sıra: paralel worker'lar arasında satır kilidi deadlock'u olmasın
+                    keys = sorted(summaries, key=lambda key: key[0])
+                    self.db.executemany(cursor, THREAD_SUMMARY_UPDATE, [summaries[k] for k in keys])
+                    epochs = [(epoch, thread_id, epoch) for thread_id, epoch in keys if epoch is not None]
+                    if epochs:
+                        self.db.executemany(cursor, SHREDDED_EPOCH_MARKER, epochs)
+                    thread_ids = sorted({thread_id for thread_id, _ in keys})
+                    if self._listeners:
+                        placeholders = ', '.join('?' for _ in thread_ids)
+                        self.db.execute(
+                            cursor,
+                            f'SELECT {THREAD_PATCH_COLUMNS} FROM threads WHERE id IN ({placeholders})',
+                            thread_ids
+                        )
+                        changed = [dict(row) for row in cursor.fetchall()]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        if summaries and self._listeners:
+            self._notify(changed)
+
+    def add_listener(self, callback):
+        """Flush sonrası güncellenen thread özetleriyle çağrılacak callback ekle"""
+        self._listeners.append(callback)
+
+    def _notify(self, threads):
+        for callback in self._listeners:
+            try:
+                callback(threads)
+            except Exception as e:
+                # Listener hatası yazılmış satırları etkilememeli
+                self._stats['listener_errors'] += 1
+                self._stats['last_listener_error'] = str(e)[:200]
+
+    def get_stats(self):
+        """Kuyruk derinliği ve flush gecikmesi istatistikleri"""
+        with self._cond:
+            depth = len(self._pending)
+        stats = dict(self._stats)
+        stats['queue_depth'] = depth
+        stats['avg_flush_ms'] = round(stats.pop('total_flush_ms') / stats['flushes'], 3) if stats['flushes'] else 0.0
+        stats['flush_interval_ms'] = self.flush_interval * 1000
+        stats['max_batch'] = self.max_batch
+        return stats
+
 class Database:
     def __init__(self):
         self.database_url = Config.DATABASE_URL
@@ -22,6 +379,9 @@ class Database:
             self.database_url = self.database_url.replace('postgres://', 'postgresql://', 1)
         self.is_postgres = 'postgres' in self.database_url.lower()
         self.sqlite_path = Config.SQLITE_PATH
+        # Mesaj created_at'i şema varsayılanının saatinden: Postgres'te NOW() (UTC),
+        # SQLite'ta datetime('now', '+3 hours')
+        self.message_clock = MessageClock(timezone.utc if self.is_postgres else TURKEY_TZ)
 
         # Connection pooling
         self._pool = None
@@ -40,6 +400,26 @@ class Database:
                 keepalives_count=5
             )
 
+        # Mesaj/telegram satırları için group-commit writer
+        self.writer = WriteBehindQueue(
+            self,
+            flush_interval=Config.WRITE_BEHIND_FLUSH_MS / 1000,
+            max_batch=Config.WRITE_BEHIND_MAX_BATCH
+        )
+        self._delete_listeners = []
+
+    def add_delete_listener(self, callback):
+        """Thread'ler silindikten (tümü silme veya purge) sonra id listesiyle çağrılacak callback ekle"""
+        self._delete_listeners.append(callback)
+
+    def _notify_deleted(self, thread_ids):
+        for callback in self._delete_listeners:
+            try:
+                callback(thread_ids)
+            except Exception:
+                # Listener hatası silinmiş satırları etkilememeli
+                pass
+
     def _get_sqlite_connection(self):
         """SQLite için thread-local connection"""
         if not hasattr(self._local, 'sqlite_conn'):
@@ -63,95 +443,372 @@ class Database:
             conn = self._get_sqlite_connection()
             yield conn
     
-    def execute_query(self, query, params=(), fetch='all'):
+    def execute_query(self, query, params=(), fetch='all', commit=False):
         query = query.replace('?', '%s') if self.is_postgres else query
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             if fetch == 'one':
                 result = cursor.fetchone()
+                if commit:
+                    conn.commit()
                 return dict(result) if result else None
             elif fetch == 'all':
-                return [dict(row) for row in cursor.fetchall()]
+                rows = [dict(row) for row in cursor.fetchall()]
+                if commit:
+                    conn.commit()
+                return rows
             else:
                 conn.commit()
                 return None
-    
+
+    def execute(self, cursor, query, params=()):
+        """Açık bir transaction'ın cursor'ında statement çalıştır"""
+        cursor.execute(query.replace('?', '%s') if self.is_postgres else query, params)
+        return cursor
+
+    def next_threads_version(self, cursor):
+        """Thread listesi sayacını arttır (çağıranın transaction'ı içinde)"""
+        row = self.execute(cursor, NEXT_THREADS_VERSION).fetchone()
+        return dict(row)['value']
+
+    def get_threads_version(self):
+        row = self.execute_query("SELECT value FROM sync_counters WHERE name = 'threads'", fetch='one')
+        return row['value'] if row else 0
+
+    def create_thread(self, thread_id, display_name):
+        """Yeni thread ekle ve delta-sync versiyonunu ilerlet"""
+        with self.get_connection() as conn:
+            try:
+                cursor = conn.cursor()
+                version = self.next_threads_version(cursor)
+                self.execute(
+                    cursor,
+                    'INSERT INTO threads (id, display_name, version) VALUES (?, ?, ?)',
+                    (thread_id, display_name, version)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def clear_thread_messages(self, thread_id):
+        """Thread'i crypto-shred ile temizle: O(1), mesaj sayısından bağımsız
+
+        Mevcut epoch'un anahtarı yok edilir (purge işareti olarak kalır) ve
+        thread yeni epoch'a geçer; eski mesajlar anında görünmez ve
+        okunamaz olur. Satırlar purge_shredded_messages ile arka planda silinir.
+        """
+        with self.get_connection() as conn:
+            try:
+                cursor = conn.cursor()
+                self.execute(
+                    cursor,
+                    'INSERT INTO thread_keys (thread_id, epoch, wrapped_key) '
+                    'SELECT id, key_epoch, NULL FROM threads WHERE id = ? '
+                    'ON CONFLICT (thread_id, epoch) DO UPDATE SET wrapped_key = NULL',
+                    (thread_id,)
+                )
+                self.execute(cursor, 'DELETE FROM telegram_links WHERE thread_id = ?', (thread_id,))
+                version = self.next_threads_version(cursor)
+                self.execute(
+                    cursor,
+                    'UPDATE threads SET message_count = 0, last_message_at = NULL, last_message_preview = NULL, '
+                    'last_sender = NULL, unread_count = 0, key_epoch = key_epoch + 1, version = ? WHERE id = ?',
+                    (version, thread_id)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def mark_thread_read(self, thread_id):
+        """Okunmamış sayacını sıfırla; değişiklik olduysa güncel özeti döndür"""
+        with self.get_connection() as conn:
+            try:
+                cursor = conn.cursor()
+                self.execute(cursor, 'SELECT unread_count FROM threads WHERE id = ?', (thread_id,))
+                row = cursor.fetchone()
+                if not row or not dict(row)['unread_count']:
+                    conn.rollback()
+                    return None
+                version = self.next_threads_version(cursor)
+                self.execute(
+                    cursor,
+                    'UPDATE threads SET unread_count = 0, version = ? WHERE id = ?',
+                    (version, thread_id)
+                )
+                self.execute(cursor, f'SELECT {THREAD_PATCH_COLUMNS} FROM threads WHERE id = ?', (thread_id,))
+                thread = dict(cursor.fetchone())
+                conn.commit()
+                return thread
+            except Exception:
+                conn.rollback()
+                raise
+
+    def delete_all_threads(self):
+        """Tüm veriyi sil; silinen thread'ler delta-sync için tombstone olarak kalır
+
+        Kısa bir transaction'da tüm thread anahtarları yok edilir ve
+        epoch'lar artar; mesajlar anında okunamaz olur. Mesajı olmayan
+        thread'ler hemen silinir. Diğerleri (messages.thread_id FK) LIVE_THREAD
+        ile gizlenir; mesajları ve satırları purge_shredded_messages ile
+        batch'ler halinde silinir.
+        """
+        with self.get_connection() as conn:
+            try:
+                cursor = conn.cursor()
+                version = self.next_threads_version(cursor)
+                self.execute(cursor, 'SELECT id FROM threads')
+                thread_ids = [dict(row)['id'] for row in cursor.fetchall()]
+                self.execute(
+                    cursor,
+                    # WHERE: SQLite'ta INSERT ... SELECT sonrası ON CONFLICT'in parse edilmesi için gerekli
+                    'INSERT INTO thread_tombstones (thread_id, version) SELECT id, ? FROM threads WHERE id IS NOT NULL '
+                    'ON CONFLICT (thread_id) DO UPDATE SET version = excluded.version',
+                    (version,)
+                )
+                self.execute(cursor, 'DELETE FROM thread_keys')
+                self.execute(cursor, 'DELETE FROM telegram_links')
+                self.execute(cursor, 'DELETE FROM telegram_inbound')
+                self.execute(
+                    cursor,
+                    'DELETE FROM threads WHERE NOT EXISTS (SELECT 1 FROM messages WHERE thread_id = threads.id)'
+                )
+                self.execute(
+                    cursor,
+                    'INSERT INTO thread_keys (thread_id, epoch, wrapped_key) SELECT id, ?, NULL FROM threads',
+                    (DELETED_THREAD_EPOCH,)
+                )
+                self.execute(cursor, 'UPDATE threads SET key_epoch = key_epoch + 1')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if thread_ids:
+            self._notify_deleted(thread_ids)
+
+    def purge_shredded_messages(self, batch_size=1000):
+        """Anahtarı yok edilmiş epoch'ların mesaj satırlarını batch'ler halinde sil
+
+        Her batch ayrı, kısa bir transaction'dır. Bir epoch'un satırları
+        bitince purge işareti (wrapped_key NULL) de silinir. DELETED_THREAD_EPOCH
+        işaretinde thread'in tüm mesajları silinir, ardından thread satırı ve
+        anahtar kayıtları. Silinen mesaj sayısını döndürür.
+        """
+        purged = 0
+        while True:
+            markers = self.execute_query(
+                'SELECT thread_id, epoch FROM thread_keys WHERE wrapped_key IS NULL LIMIT 100'
+            )
+            if not markers:
+                return purged
+            for marker in markers:
+                thread_id, epoch = marker['thread_id'], marker['epoch']
+                whole_thread = epoch == DELETED_THREAD_EPOCH
+                while True:
+                    with self.get_connection() as conn:
+                        try:
+                            cursor = conn.cursor()
+                            if whole_thread:
+                                self.execute(
+                                    cursor,
+                                    'DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE thread_id = ? LIMIT ?)',
+                                    (thread_id, batch_size)
+                                )
+                            else:
+                                self.execute(
+                                    cursor,
+                                    'DELETE FROM messages WHERE id IN ('
+                                    'SELECT id FROM messages WHERE thread_id = ? AND key_epoch = ? LIMIT ?)',
+                                    (thread_id, epoch, batch_size)
+                                )
+                            deleted = cursor.rowcount
+                            if deleted < batch_size and whole_thread:
+                                self.execute(cursor, 'DELETE FROM thread_keys WHERE thread_id = ?', (thread_id,))
+                                self.execute(cursor, 'DELETE FROM threads WHERE id = ?', (thread_id,))
+                            elif deleted < batch_size:
+                                self.execute(
+                                    cursor,
+                                    'DELETE FROM thread_keys WHERE thread_id = ? AND epoch = ? AND wrapped_key IS NULL',
+                                    (thread_id, epoch)
+                                )
+                            conn.commit()
+                        except Exception:
+                            conn.rollback()
+                            raise
+                    if deleted < batch_size and whole_thread:
+                        self._notify_deleted([thread_id])
+                    purged += max(deleted, 0)
+                    if deleted < batch_size:
+                        break
+
+    def get_thread_changes(self, since, version=None):
+        """since versiyonundan sonra oluşan/değişen thread'ler ve silinen id'ler
+
+        Sayaç thread'lerden önce okunur; böylece arada commit edilen bir
+        değişiklik atlanmaz, en kötü ihtimalle bir sonraki sync'te tekrar gelir.
+        """
+        if version is None:
+            version = self.get_threads_version()
+        columns = ('id, display_name, created_at, last_activity_at, last_message_at, '
+                   'last_message_preview, last_sender, message_count, unread_count, version')
+        if since:
+            threads = self.execute_query(
+                f'SELECT {columns} FROM threads WHERE version > ? AND {LIVE_THREAD} ORDER BY version',
+                (since,)
+            )
+            deleted = [row['thread_id'] for row in self.execute_query(
+                'SELECT thread_id FROM thread_tombstones WHERE version > ?',
+                (since,)
+            )]
+        else:
+            threads = self.execute_query(f'SELECT {columns} FROM threads WHERE {LIVE_THREAD}')
+            deleted = []
+        return threads, deleted, version
+
+    def executemany(self, cursor, query, rows):
+        """Aynı statement'ı çok satırla çalıştır (Postgres'te execute_batch ile)"""
+        if self.is_postgres and psycopg2:
+            psycopg2.extras.execute_batch(cursor, query.replace('?', '%s'), rows, page_size=100)
+        else:
+            cursor.executemany(query, rows)
+
+    def insert_message(self, thread_id, sender, msg_type, content_text='', file_path='', encrypt=None, wait=True):
+        """Mesajı write-behind kuyruğuna ver ve düz metin DTO döndür
+
+        Satır (created_at dahil) process içinde kurulur; DB'ye geri okumaya
+        gerek yoktur. threads özet kolonları aynı flush'ta güncellenir. wait=True ise satır commit edilene kadar beklenir ve
+        yazma hatası çağırana yükselir. encrypt(text, thread_id) (token, key epoch)
+        döndürür; epoch None ise satır flush anındaki thread epoch'una yazılır.
+        """
+        created_at, msg_id = self.message_clock.next()
+        stored_text, key_epoch = content_text, None
+        if encrypt and content_text and msg_type == 'text':
+            # encrypt (token, epoch) döndürür; satır metnin mühürlendiği epoch'a yazılır
+            stored_text, key_epoch = encrypt(content_text, thread_id)
+        pending = self.writer.submit(
+            'messages',
+            (msg_id, thread_id, sender, msg_type, stored_text, file_path, created_at, key_epoch, thread_id),
+            summary=(thread_id, created_at, build_message_preview(content_text), sender, key_epoch)
+        )
+        if wait:
+            pending.wait(Config.WRITE_BEHIND_WAIT_TIMEOUT)
+        return {
+            'id': msg_id,
+            'thread_id': thread_id,
+            'sender': sender,
+            'type': msg_type,
+            'content_text': content_text,
+            'file_path': file_path,
+            'created_at': created_at
+        }
+
+    def fetch_message_page(self, thread_id, limit, before=None, after=None):
+        """(thread_id, created_at, id) index'i üzerinden keyset sayfalama
+
+        before/after decode edilmiş (created_at, id) çiftleridir. limit+1 satır
+        okunarak COUNT(*) olmadan has_more hesaplanır. Mesajlar her zaman
+        kronolojik (eskiden yeniye) sırada MessageRecord olarak döner.
+        """
+        if after is not None:
+            rows = self.execute_query(
+                f'SELECT {MESSAGE_SELECT} FROM messages WHERE thread_id = ? AND {VISIBLE_EPOCH} '
+                'AND (created_at, id) > (?, ?) ORDER BY created_at ASC, id ASC LIMIT ?',
+                (thread_id, thread_id, after[0], after[1], limit + 1)
+            )
+            has_more = len(rows) > limit
+            return [MessageRecord.from_row(row) for row in rows[:limit]], has_more
+
+        if before is not None:
+            rows = self.execute_query(
+                f'SELECT {MESSAGE_SELECT} FROM messages WHERE thread_id = ? AND {VISIBLE_EPOCH} '
+                'AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?',
+                (thread_id, thread_id, before[0], before[1], limit + 1)
+            )
+        else:
+            rows = self.execute_query(
+                f'SELECT {MESSAGE_SELECT} FROM messages WHERE thread_id = ? AND {VISIBLE_EPOCH} '
+                'ORDER BY created_at DESC, id DESC LIMIT ?',
+                (thread_id, thread_id, limit + 1)
+            )
+        has_more = len(rows) > limit
+        records = [MessageRecord.from_row(row) for row in rows[:limit]]
+        records.reverse()
+        return records, has_more
+
     def get_current_timestamp(self):
         """Türkiye saati için timestamp döndür"""
         now = datetime.now(TURKEY_TZ)
         return now.strftime('%Y-%m-%d %H:%M:%S')
     
-    def init_db(self):
-        if self.is_postgres:
-            timestamp_default = "NOW()"
-        else:
-            timestamp_default = "(datetime('now', '+3 hours'))"
-        
-        schema = '''
-        CREATE TABLE IF NOT EXISTS threads (
-            id TEXT PRIMARY KEY,
-            display_name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT {ts},
-            last_activity_at TIMESTAMP DEFAULT {ts}
-        );
-        
-        CREATE TABLE IF NOT EXISTS messages (
-            id TEXT PRIMARY KEY,
-            thread_id TEXT NOT NULL,
-            sender TEXT NOT NULL,
-            type TEXT NOT NULL,
-            content_text TEXT,
-            file_path TEXT,
-            created_at TIMESTAMP DEFAULT {ts},
-            FOREIGN KEY (thread_id) REFERENCES threads(id)
-        );
-        
-        CREATE TABLE IF NOT EXISTS telegram_links (
-            id {pk_type} {pk_constraint},
-            thread_id TEXT NOT NULL,
-            tg_chat_id TEXT NOT NULL,
-            tg_message_id INTEGER NOT NULL,
-            FOREIGN KEY (thread_id) REFERENCES threads(id)
-        );
-        
-        CREATE TABLE IF NOT EXISTS telegram_inbound (
-            id {pk_type} {pk_constraint},
-            tg_chat_id TEXT NOT NULL,
-            tg_message_id INTEGER NOT NULL,
-            processed_at TIMESTAMP DEFAULT {ts},
-            UNIQUE (tg_chat_id, tg_message_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS otp_codes (
-            id {pk_type} {pk_constraint},
-            code TEXT NOT NULL UNIQUE,
-            expires_at TIMESTAMP NOT NULL,
-            created_at TIMESTAMP DEFAULT {ts}
-        );
-        '''.format(
-            ts=timestamp_default,
-            pk_type='SERIAL' if self.is_postgres else 'INTEGER',
-            pk_constraint='PRIMARY KEY' if self.is_postgres else 'PRIMARY KEY AUTOINCREMENT'
-        )
-        
-        for statement in schema.split(';'):
-            if statement.strip():
-                self.execute_query(statement, fetch=None)
-        
-        indexes = [
-            'CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id)',
-            'CREATE INDEX IF NOT EXISTS idx_messages_created ON messages(created_at)',
-            'CREATE INDEX IF NOT EXISTS idx_threads_activity ON threads(last_activity_at)',
-            'CREATE INDEX IF NOT EXISTS idx_telegram_links_thread ON telegram_links(thread_id)',
-            'CREATE INDEX IF NOT EXISTS idx_telegram_links_tg_msg ON telegram_links(tg_message_id)',
-            'CREATE INDEX IF NOT EXISTS idx_telegram_inbound_chat ON telegram_inbound(tg_chat_id)'
-        ]
-        
-        for idx in indexes:
-            try:
-                self.execute_query(idx, fetch=None)
-            except:
-                pass
+    def rebuild_thread_summaries(self, decrypt=None, batch_size=500, bump_version=True, visible_only=True):
+        """threads özet kolonlarını messages tablosundan yeniden hesapla
+
+        Backfill ve toplu mesaj silme (retention) sonrası kullanılır. Thread'ler
+        id sırasıyla batch'ler halinde işlenir; decrypt verilirse son metin
+        mesajından önizleme üretilir. bump_version ile güncellenen thread'ler
+        delta-sync istemcilerine tekrar gönderilir. visible_only yalnızca
+        thread'in güncel epoch'undaki mesajları sayar (key_epoch kolonundan
+        önceki migration'lar False geçer).
+        """
+        epoch_filter = 'AND m.key_epoch = threads.key_epoch' if visible_only else ''
+        latest_filter = 'AND key_epoch = t.key_epoch' if visible_only else ''
+        last_id = ''
+        while True:
+            batch = self.execute_query(
+                'SELECT id FROM threads WHERE id > ? ORDER BY id LIMIT ?',
+                (last_id, batch_size)
+            )
+            if not batch:
+                return
+            ids = [row['id'] for row in batch]
+            last_id = ids[-1]
+            placeholders = ', '.join('?' for _ in ids)
+
+            self.execute_query(f'''
+                UPDATE threads SET
+                    message_count = (SELECT COUNT(*) FROM messages m WHERE m.thread_id = threads.id {epoch_filter}),
+                    last_message_at = (SELECT MAX(m.created_at) FROM messages m
+                                       WHERE m.thread_id = threads.id {epoch_filter}),
+                    last_sender = (SELECT m.sender FROM messages m WHERE m.thread_id = threads.id {epoch_filter}
+                                   ORDER BY m.created_at DESC LIMIT 1)
+                WHERE id IN ({placeholders})
+            ''', ids, fetch=None)
+
+            latest = self.execute_query(f'''
+                SELECT t.id AS thread_id, m.type, m.content_text
+                FROM threads t
+                LEFT JOIN messages m ON m.id = (
+                    SELECT id FROM messages WHERE thread_id = t.id {latest_filter} ORDER BY created_at DESC LIMIT 1
+                )
+                WHERE t.id IN ({placeholders})
+            ''', ids)
+            previews = []
+            for row in latest:
+                preview = None
+                if row['type'] is not None:
+                    text = row['content_text']
+                    if text and row['type'] == 'text':
+                        try:
+                            text = decrypt(text, row['thread_id']) if decrypt else None
+                        except Exception:
+                            text = None
+                        preview = build_message_preview(text) if text is not None else UNREADABLE_PREVIEW
+                    else:
+                        preview = build_message_preview(text)
+                previews.append((preview, row['thread_id']))
+
+            with self.get_connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    self.executemany(cursor, 'UPDATE threads SET last_message_preview = ? WHERE id = ?', previews)
+                    if bump_version:
+                        version = self.next_threads_version(cursor)
+                        self.execute(cursor, f'UPDATE threads SET version = ? WHERE id IN ({placeholders})', [version] + ids)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
 
 db = Database()
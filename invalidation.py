@@ -0,0 +1,216 @@
+import json
+import time
+import uuid
+import select
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from config import Config
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:
+    psycopg2 = None
+
+logger = logging.getLogger(__name__)
+
+# Postgres NOTIFY kanalı
+CHANNEL = 'chat_cache_invalidate'
+
+# publish_async batch'inde mesaj başına en fazla key (pg_notify payload'ı < 8000 byte)
+MAX_BATCH_KEYS = 100
+
+class InvalidationBus:
+    """Broadcast cache invalidations from this worker to the other workers
+
+    Messages are (kind, key) pairs, e.g. ('thread', thread_id) or
+    ('thread_list', ''). A worker never receives its own messages; it has
+    already applied the invalidation locally before publishing. Receivers
+    measure propagation lag from the publish timestamp in the payload.
+
+    publish_async() is for hot paths (one call per chat message): keys are
+    queued and a sender thread publishes everything queued so far as one
+    message per kind, so the caller never waits on the transport and a
+    burst costs one round trip instead of one per message.
+    """
+
+    bus_name = 'base'
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:12]
+        self._subscribers: List[Callable[[str, str], None]] = []
+        self._lock = threading.Lock()
+        self._queued: Dict[str, Dict[str, None]] = {}  # kind -> sıralı key kümesi
+        self._queue_event = threading.Event()
+        self._sender: Optional[threading.Thread] = None
+        self._stats = {
+            'published': 0,
+            'queued': 0,
+            'batched_keys': 0,
+            'received': 0,
+            'publish_errors': 0,
+            'handler_errors': 0,
+            'lag_ms_last': 0.0,
+            'lag_ms_max': 0.0,
+            'lag_ms_total': 0.0,
+        }
+
+    def subscribe(self, callback: Callable[[str, str], None]):
+        """callback(kind, key) is called for invalidations from other workers"""
+        self._subscribers.append(callback)
+
+    def publish(self, kind: str, key: Union[str, List[str]] = ''):
+        """Yayınla; key bir liste ise alıcılar her key için callback'i çağırır"""
+        payload = json.dumps(
+            {'o': self.origin, 'k': kind, 'i': key, 't': time.time()},
+            separators=(',', ':')
+        )
+        try:
+            self._send(payload)
+            with self._lock:
+                self._stats['published'] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats['publish_errors'] += 1
+            logger.warning(f"Cache invalidation publish failed: {e}")
+
+    def publish_async(self, kind: str, key: str = ''):
+        """Kuyruğa al; arka plan thread'i bekleyenleri kind başına tek mesajla yayınlar"""
+        with self._lock:
+            self._queued.setdefault(kind, {})[key] = None
+            self._stats['queued'] += 1
+            if self._sender is None or not self._sender.is_alive():
+                self._sender = threading.Thread(target=self._send_queued, name='cache-invalidation-sender', daemon=True)
+                self._sender.start()
+        self._queue_event.set()
+
+    def _send_queued(self):
+        while True:
+            self._queue_event.wait()
+            self._queue_event.clear()
+            with self._lock:
+                queued, self._queued = self._queued, {}
+            for kind, keys in queued.items():
+                keys = list(keys)
+                with self._lock:
+                    self._stats['batched_keys'] += len(keys)
+                for start in range(0, len(keys), MAX_BATCH_KEYS):
+                    self.publish(kind, keys[start:start + MAX_BATCH_KEYS])
+
+    def _send(self, payload: str):
+        raise NotImplementedError
+
+    def _deliver(self, payload: str):
+        """Apply a received payload (called by the transport)"""
+        message = json.loads(payload)
+        if message.get('o') == self.origin:
+            return
+        lag_ms = max((time.time() - message.get('t', time.time())) * 1000, 0.0)
+        with self._lock:
+            stats = self._stats
+            stats['received'] += 1
+            stats['lag_ms_last'] = round(lag_ms, 3)
+            stats['lag_ms_total'] += lag_ms
+            if lag_ms > stats['lag_ms_max']:
+                stats['lag_ms_max'] = round(lag_ms, 3)
+        keys = message.get('i', '')
+        for key in keys if isinstance(keys, list) else [keys]:
+            for callback in self._subscribers:
+                try:
+                    callback(message.get('k'), key)
+                except Exception as e:
+                    with self._lock:
+                        self._stats['handler_errors'] += 1
+                    logger.warning(f"Cache invalidation handler failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        received = stats['received']
+        lag_ms_total = stats.pop('lag_ms_total')
+        stats['lag_ms_avg'] = round(lag_ms_total / received, 3) if received else 0.0
+        stats['bus'] = self.bus_name
+        stats['origin'] = self.origin
+        return stats
+
+class LocalInvalidationBus(InvalidationBus):
+    """In-process stand-in for SQLite deployments and tests
+
+    Buses attached to the same hub act as separate workers; delivery is
+    synchronous. A single-process deployment has one bus on its hub, so
+    publishing is effectively free.
+    """
+
+    bus_name = 'local'
+    _default_hub: List['LocalInvalidationBus'] = []
+
+    def __init__(self, hub: Optional[List['LocalInvalidationBus']] = None):
+        super().__init__()
+        self._hub = self._default_hub if hub is None else hub
+        self._hub.append(self)
+
+    def _send(self, payload: str):
+        for bus in list(self._hub):
+            if bus is not self:
+                bus._deliver(payload)
+
+class PostgresInvalidationBus(InvalidationBus):
+    """Postgres LISTEN/NOTIFY transport
+
+    Publishing runs pg_notify through the app's connection pool (delivered on
+    commit). A daemon thread keeps one dedicated autocommit connection in
+    LISTEN mode and waits on its socket, so notifications are applied as soon
+    as Postgres sends them. The listener reconnects with backoff.
+    """
+
+    bus_name = 'postgres'
+
+    def __init__(self, database, dsn: str):
+        super().__init__()
+        self.db = database
+        self.dsn = dsn
+        self._stats['reconnects'] = 0
+        self._thread = threading.Thread(target=self._listen_forever, name='cache-invalidation', daemon=True)
+        self._thread.start()
+
+    def _send(self, payload: str):
+        self.db.execute_query('SELECT pg_notify(?, ?)', (CHANNEL, payload), fetch=None)
+
+    def _listen_forever(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f'LISTEN {CHANNEL}')
+                backoff = 1
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._deliver(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener error: {e}; reconnecting in {backoff}s")
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+def create_invalidation_bus(database) -> InvalidationBus:
+    """CACHE_INVALIDATION_BUS: auto (Postgres'te LISTEN/NOTIFY), postgres veya local"""
+    mode = Config.CACHE_INVALIDATION_BUS
+    if mode in ('auto', 'postgres') and database.is_postgres and psycopg2:
+        return PostgresInvalidationBus(database, database.database_url)
+    if mode == 'postgres':
+        logger.warning("CACHE_INVALIDATION_BUS=postgres requires a Postgres database; using local bus")
+    return LocalInvalidationBus()
@@ -0,0 +1,56 @@
+"""Temel tablolar ve index'ler (eski Database.init_db şeması)"""
+
+def upgrade(ctx):
+    ctx.execute_script('''
+        CREATE TABLE IF NOT EXISTS threads (
+            id TEXT PRIMARY KEY,
+            display_name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT {ts},
+            last_activity_at TIMESTAMP DEFAULT {ts}
+        );
+
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            thread_id TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            type TEXT NOT NULL,
+            content_text TEXT,
+            file_path TEXT,
+            created_at TIMESTAMP DEFAULT {ts},
+            FOREIGN KEY (thread_id) REFERENCES threads(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS telegram_links (
+            id {pk_type} {pk_constraint},
+            thread_id TEXT NOT NULL,
+            tg_chat_id TEXT NOT NULL,
+            tg_message_id INTEGER NOT NULL,
+            FOREIGN KEY (thread_id) REFERENCES threads(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS telegram_inbound (
+            id {pk_type} {pk_constraint},
+            tg_chat_id TEXT NOT NULL,
+            tg_message_id INTEGER NOT NULL,
+            processed_at TIMESTAMP DEFAULT {ts},
+            UNIQUE (tg_chat_id, tg_message_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS otp_codes (
+            id {pk_type} {pk_constraint},
+            code TEXT NOT NULL UNIQUE,
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT {ts}
+        );
+    '''.format(
+        ts=ctx.timestamp_default,
+        pk_type='SERIAL' if ctx.is_postgres else 'INTEGER',
+        pk_constraint='PRIMARY KEY' if ctx.is_postgres else 'PRIMARY KEY AUTOINCREMENT'
+    ))
+
+    ctx.create_index('idx_messages_thread', 'messages', 'thread_id')
+    ctx.create_index('idx_messages_created', 'messages', 'created_at')
+    ctx.create_index('idx_threads_activity', 'threads', 'last_activity_at')
+    ctx.create_index('idx_telegram_links_thread', 'telegram_links', 'thread_id')
+    ctx.create_index('idx_telegram_links_tg_msg', 'telegram_links', 'tg_message_id')
+    ctx.create_index('idx_telegram_inbound_chat', 'telegram_inbound', 'tg_chat_id')
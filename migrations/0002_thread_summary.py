@@ -0,0 +1,35 @@
+"""threads özet kolonları (/api/threads için) ve mevcut veri backfill'i"""
+
+BATCH_SIZE = 500
+
+def upgrade(ctx):
+    added = False
+    added |= ctx.add_column('threads', 'last_message_at', 'TIMESTAMP')
+    added |= ctx.add_column('threads', 'last_message_preview', 'TEXT')
+    added |= ctx.add_column('threads', 'last_sender', 'TEXT')
+    added |= ctx.add_column('threads', 'message_count', 'INTEGER NOT NULL DEFAULT 0')
+
+    # Sayaç ve zaman kolonları düz SQL ile doldurulur; önizlemeler şifre çözmeyi
+    # gerektirdiği için 0008'de (crypto_settings'ten sonra) doldurulur.
+    # Thread'ler batch'ler halinde işlenir; uzun tek bir UPDATE tabloyu kilitlemez
+    last_id = ''
+    while added:
+        batch = ctx.query('SELECT id FROM threads WHERE id > ? ORDER BY id LIMIT ?', (last_id, BATCH_SIZE))
+        if not batch:
+            break
+        ids = [row['id'] for row in batch]
+        last_id = ids[-1]
+        placeholders = ', '.join('?' for _ in ids)
+        ctx.execute(f'''
+            UPDATE threads SET
+                message_count = (SELECT COUNT(*) FROM messages m WHERE m.thread_id = threads.id),
+                last_message_at = (SELECT MAX(m.created_at) FROM messages m WHERE m.thread_id = threads.id),
+                last_sender = (SELECT m.sender FROM messages m WHERE m.thread_id = threads.id
+                               ORDER BY m.created_at DESC LIMIT 1)
+            WHERE id IN ({placeholders})
+        ''', ids)
+
+    if ctx.is_postgres:
+        ctx.create_index('idx_threads_last_message', 'threads', 'last_message_at DESC NULLS LAST')
+    else:
+        ctx.create_index('idx_threads_last_message', 'threads', 'last_message_at DESC')
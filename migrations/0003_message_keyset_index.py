@@ -0,0 +1,6 @@
+"""/api/messages keyset sayfalaması için (thread_id, created_at, id) index'i"""
+
+def upgrade(ctx):
+    ctx.create_index('idx_messages_thread_created', 'messages', 'thread_id, created_at, id')
+    # Yeni index thread_id önekini kapsıyor; eski tek kolonlu index gereksiz
+    ctx.drop_index('idx_messages_thread')
@@ -0,0 +1,21 @@
+"""Admin thread listesi delta-sync için değişiklik versiyonu ve silme kayıtları"""
+
+def upgrade(ctx):
+    ctx.add_column('threads', 'version', 'BIGINT NOT NULL DEFAULT 0')
+
+    ctx.execute_script('''
+        CREATE TABLE IF NOT EXISTS sync_counters (
+            name TEXT PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS thread_tombstones (
+            thread_id TEXT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    ''')
+    ctx.execute("INSERT INTO sync_counters (name, value) VALUES ('threads', 0) ON CONFLICT (name) DO NOTHING")
+
+    # Mevcut thread'ler version=0 kalır; since=0 istemcisi zaten tam listeyi alır
+    ctx.create_index('idx_threads_version', 'threads', 'version')
+    ctx.create_index('idx_thread_tombstones_version', 'thread_tombstones', 'version')
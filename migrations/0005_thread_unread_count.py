@@ -0,0 +1,4 @@
+"""Admin listesindeki okunmamış mesaj sayacı (thread_updated patch'leri için)"""
+
+def upgrade(ctx):
+    ctx.add_column('threads', 'unread_count', 'INTEGER NOT NULL DEFAULT 0')
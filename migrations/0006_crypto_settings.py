@@ -0,0 +1,9 @@
+"""Şifreleme ayarları (kalıcı KDF salt'ı) için anahtar/değer tablosu"""
+
+def upgrade(ctx):
+    ctx.execute_script('''
+        CREATE TABLE IF NOT EXISTS crypto_settings (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
@@ -0,0 +1,16 @@
+"""Thread başına veri anahtarları (crypto-shredding) ve mesaj anahtar epoch'u"""
+
+def upgrade(ctx):
+    # wrapped_key NULL: anahtar yok edildi, o epoch'un mesajları purge bekliyor
+    ctx.execute_script('''
+        CREATE TABLE IF NOT EXISTS thread_keys (
+            thread_id TEXT NOT NULL,
+            epoch INTEGER NOT NULL,
+            wrapped_key TEXT,
+            PRIMARY KEY (thread_id, epoch)
+        )
+    ''')
+
+    # Mevcut thread'ler ve mesajlar epoch 0'dadır; eski mesajlar master anahtarla okunmaya devam eder
+    ctx.add_column('threads', 'key_epoch', 'INTEGER NOT NULL DEFAULT 0')
+    ctx.add_column('messages', 'key_epoch', 'INTEGER NOT NULL DEFAULT 0')
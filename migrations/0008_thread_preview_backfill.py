@@ -0,0 +1,44 @@
+"""Thread son mesaj önizlemelerinin backfill'i (0006/0007'den sonra)
+
+Önizleme metin mesajlarında şifre çözmeyi gerektirir; kalıcı salt
+(crypto_settings) ve thread anahtarları var olmadan çözülen metinler
+okunamaz önizlemeye düşer. Boş ya da daha önce okunamaz kalmış
+önizlemeler thread'in güncel epoch'undaki son mesajdan doldurulur.
+"""
+from database import build_message_preview, UNREADABLE_PREVIEW
+
+BATCH_SIZE = 500
+
+def upgrade(ctx):
+    last_id = ''
+    while True:
+        batch = ctx.query(
+            'SELECT id FROM threads WHERE id > ? AND message_count > 0 '
+            'AND (last_message_preview IS NULL OR last_message_preview = ?) ORDER BY id LIMIT ?',
+            (last_id, UNREADABLE_PREVIEW, BATCH_SIZE)
+        )
+        if not batch:
+            return
+        ids = [row['id'] for row in batch]
+        last_id = ids[-1]
+        placeholders = ', '.join('?' for _ in ids)
+        latest = ctx.query(f'''
+            SELECT t.id AS thread_id, m.type, m.content_text
+            FROM threads t
+            JOIN messages m ON m.id = (
+                SELECT id FROM messages WHERE thread_id = t.id AND key_epoch = t.key_epoch
+                ORDER BY created_at DESC, id DESC LIMIT 1
+            )
+            WHERE t.id IN ({placeholders})
+        ''', ids)
+        for row in latest:
+            text = row['content_text']
+            if text and row['type'] == 'text':
+                try:
+                    text = ctx.decrypt(text, row['thread_id']) if ctx.decrypt else None
+                except Exception:
+                    text = None
+                preview = build_message_preview(text) if text is not None else UNREADABLE_PREVIEW
+            else:
+                preview = build_message_preview(text)
+            ctx.execute('UPDATE threads SET last_message_preview = ? WHERE id = ?', (preview, row['thread_id']))
@@ -0,0 +1,154 @@
+"""Versiyonlu şema migration'ları
+
+Her migration bu klasörde `NNNN_açıklama.py` adlı bir modüldür ve
+`upgrade(ctx)` fonksiyonu tanımlar. Uygulanan versiyonlar `schema_version`
+tablosunda tutulur; runner deploy/başlangıçta bir kez çalışır, request
+yolunda hiçbir şey yapmaz.
+"""
+import os
+import re
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# Postgres'te birden fazla worker aynı anda migrate etmesin diye advisory lock anahtarı
+ADVISORY_LOCK_KEY = 727001
+
+_local_lock = threading.Lock()
+
+class MigrationContext:
+    """Migration'ların kullandığı DB yardımcıları
+
+    Her statement ayrı commit edilir; statement'lar IF NOT EXISTS ile
+    idempotent yazıldığı için yarıda kalan bir migration tekrar çalıştırılabilir.
+    """
+
+    def __init__(self, database, decrypt=None):
+        self.db = database
+        self.is_postgres = database.is_postgres
+        self.decrypt = decrypt
+        self.timestamp_default = "NOW()" if self.is_postgres else "(datetime('now', '+3 hours'))"
+
+    def execute(self, query, params=()):
+        self.db.execute_query(query, params, fetch=None)
+
+    def query(self, query, params=()):
+        return self.db.execute_query(query, params)
+
+    def execute_script(self, script):
+        """';' ile ayrılmış statement'ları sırayla çalıştır"""
+        for statement in script.split(';'):
+            if statement.strip():
+                self.execute(statement)
+
+    def _execute_autocommit(self, query):
+        # CREATE/DROP INDEX CONCURRENTLY transaction içinde çalışamaz
+        with self.db.get_connection() as conn:
+            previous = conn.autocommit
+            conn.autocommit = True
+            try:
+                conn.cursor().execute(query)
+            finally:
+                conn.autocommit = previous
+
+    def columns(self, table):
+        if self.is_postgres:
+            rows = self.query(
+                'SELECT column_name AS name FROM information_schema.columns WHERE table_name = ?',
+                (table,)
+            )
+        else:
+            rows = self.query(f'PRAGMA table_info({table})')
+        return {row['name'] for row in rows}
+
+    def add_column(self, table, name, definition):
+        """Kolon yoksa ekle; eklendiyse True döner"""
+        if name in self.columns(table):
+            return False
+        self.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+        return True
+
+    def create_index(self, name, table, columns, unique=False):
+        """Index oluştur - Postgres'te CONCURRENTLY ile tabloyu kilitlemeden"""
+        unique_sql = 'UNIQUE ' if unique else ''
+        if not self.is_postgres:
+            self.execute(f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table}({columns})')
+            return
+
+        # Yarıda kalmış CONCURRENTLY build'i INVALID index bırakır; önce onu temizle
+        invalid = self.query(
+            'SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid '
+            'WHERE c.relname = ? AND NOT i.indisvalid',
+            (name,)
+        )
+        if invalid:
+            self._execute_autocommit(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        self._execute_autocommit(f'CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table}({columns})')
+
+    def drop_index(self, name):
+        if self.is_postgres:
+            self._execute_autocommit(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        else:
+            self.execute(f'DROP INDEX IF EXISTS {name}')
+
+def discover_migrations():
+    """Klasördeki migration modüllerini versiyon sırasıyla döndür"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if match:
+            module = importlib.import_module(f'{__name__}.{filename[:-3]}')
+            migrations.append((int(match.group(1)), match.group(2), module))
+    return migrations
+
+def _ensure_version_table(database):
+    database.execute_query(f'''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT {"NOW()" if database.is_postgres else "(datetime('now', '+3 hours'))"}
+        )
+    ''', fetch=None)
+
+def applied_versions(database):
+    return {row['version'] for row in database.execute_query('SELECT version FROM schema_version')}
+
+def _apply_pending(database, decrypt):
+    _ensure_version_table(database)
+    done = applied_versions(database)
+    applied = []
+    ctx = MigrationContext(database, decrypt=decrypt)
+    for version, name, module in discover_migrations():
+        if version in done:
+            continue
+        logger.info(f'Applying migration {version:04d}_{name}')
+        module.upgrade(ctx)
+        database.execute_query(
+            'INSERT INTO schema_version (version, name) VALUES (?, ?) ON CONFLICT (version) DO NOTHING',
+            (version, name),
+            fetch=None
+        )
+        applied.append(f'{version:04d}_{name}')
+    return applied
+
+def run_migrations(database, decrypt=None):
+    """Bekleyen migration'ları sırayla uygula, uygulananların adlarını döndür"""
+    with _local_lock:
+        if not database.is_postgres:
+            return _apply_pending(database, decrypt)
+
+        # Lock'u ayrı bir bağlantıda tut; migration'lar diğer bağlantıları kullanır
+        with database.get_connection() as lock_conn:
+            lock_conn.autocommit = True
+            cursor = lock_conn.cursor()
+            cursor.execute('SELECT pg_advisory_lock(%s)', (ADVISORY_LOCK_KEY,))
+            try:
+                return _apply_pending(database, decrypt)
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (ADVISORY_LOCK_KEY,))
+                lock_conn.autocommit = False
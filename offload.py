@@ -0,0 +1,109 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+try:
+    import eventlet.patcher
+    import eventlet.tpool
+except ImportError:
+    eventlet = None
+
+try:
+    import gevent
+    import gevent.monkey
+except ImportError:
+    gevent = None
+
+logger = logging.getLogger(__name__)
+
+class BlockingExecutor:
+    """Run CPU-bound work (key derivation, page decrypt, HTML sanitizing) off the green hub
+
+    Under eventlet or gevent every greenlet shares one OS thread, so a long
+    PBKDF2 or a page of decrypts stalls all websockets until it finishes.
+    Jobs are handed to the hub's native thread pool (eventlet.tpool or the
+    gevent hub threadpool); the calling greenlet waits while the hub keeps
+    serving others. With real threads (async_mode='threading') there is no
+    hub and jobs run inline.
+
+    Jobs must be pure CPU: no DB or socket I/O, which is green under the
+    hub. Jobs smaller than min_bytes run inline, because the hand-off costs
+    more than the work.
+    """
+
+    def __init__(self, mode: str = 'auto', min_bytes: int = 4096):
+        self.requested_mode = mode
+        self.min_bytes = min_bytes
+        self._mode: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'offloaded': 0,
+            'inline': 0,
+            'errors': 0,
+            'offload_ms_total': 0.0,
+            'offload_ms_max': 0.0,
+        }
+
+    @property
+    def mode(self) -> str:
+        """eventlet | gevent | inline; monkey patching sonrası ilk kullanımda belirlenir"""
+        if self._mode is None:
+            self._mode = self._detect_mode()
+            logger.info(f"Blocking work executor: {self._mode}")
+        return self._mode
+
+    def _detect_mode(self) -> str:
+        requested = self.requested_mode
+        if requested in ('off', 'inline'):
+            return 'inline'
+        if requested in ('auto', 'eventlet') and eventlet is not None and eventlet.patcher.is_monkey_patched('thread'):
+            return 'eventlet'
+        if requested in ('auto', 'gevent') and gevent is not None and gevent.monkey.is_module_patched('threading'):
+            return 'gevent'
+        if requested != 'auto':
+            logger.warning(f"BLOCKING_OFFLOAD={requested} but that hub is not active; running inline")
+        return 'inline'
+
+    def run(self, func: Callable[..., Any], *args, size: Optional[int] = None, **kwargs) -> Any:
+        """func(*args, **kwargs) sonucunu döndür; size (byte) min_bytes altındaysa inline
+
+        size verilmezse iş her zaman büyük sayılır (ör. anahtar türetme).
+        """
+        mode = self.mode
+        if mode == 'inline' or (size is not None and size < self.min_bytes):
+            self._stats['inline'] += 1
+            return func(*args, **kwargs)
+
+        started = time.perf_counter()
+        try:
+            if mode == 'eventlet':
+                result = eventlet.tpool.execute(func, *args, **kwargs)
+            else:
+                result = gevent.get_hub().threadpool.apply(func, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._stats
+            stats['offloaded'] += 1
+            stats['offload_ms_total'] += elapsed_ms
+            if elapsed_ms > stats['offload_ms_max']:
+                stats['offload_ms_max'] = round(elapsed_ms, 3)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        offload_ms_total = stats.pop('offload_ms_total')
+        stats['offload_ms_avg'] = round(offload_ms_total / stats['offloaded'], 3) if stats['offloaded'] else 0.0
+        stats['mode'] = self.mode
+        stats['min_bytes'] = self.min_bytes
+        return stats
+
+# Global executor instance
+blocking_executor = BlockingExecutor(Config.BLOCKING_OFFLOAD, Config.OFFLOAD_MIN_BYTES)
@@ -0,0 +1,159 @@
+import time
+import atexit
+import threading
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+from database import db
+
+class PresenceRegistry:
+    """In-memory visitor presence with batched last_activity_at persistence
+
+    Heartbeats only update a dict; a background loop writes the collected
+    last-seen times to threads.last_activity_at in one batch every
+    flush_interval seconds and detects visitors that went offline. Listeners
+    are called only on online/offline transitions.
+    """
+
+    def __init__(self, database, flush_interval: float = 10, timeout: int = 120):
+        self.db = database
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self._last_seen: Dict[str, float] = {}
+        self._dirty: Dict[str, str] = {}
+        self._listeners: List[Callable[[str, bool], None]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._bus = None
+        self._stats = {
+            'heartbeats': 0,
+            'transitions': 0,
+            'flushes': 0,
+            'rows_written': 0,
+            'flush_errors': 0,
+            'listener_errors': 0,
+        }
+        atexit.register(self.flush)
+
+    def add_listener(self, callback: Callable[[str, bool], None]):
+        """callback(thread_id, online) is called on presence transitions"""
+        self._listeners.append(callback)
+
+    def touch(self, thread_id: str) -> bool:
+        """Record visitor activity; returns True if the thread just came online"""
+        timestamp = self.db.get_current_timestamp()
+        with self._lock:
+            self._ensure_thread()
+            came_online = thread_id not in self._last_seen
+            self._last_seen[thread_id] = time.monotonic()
+            self._dirty[thread_id] = timestamp
+            self._stats['heartbeats'] += 1
+        if came_online:
+            self._notify(thread_id, True)
+        return came_online
+
+    def is_online(self, thread_id: str) -> bool:
+        with self._lock:
+            seen = self._last_seen.get(thread_id)
+        return seen is not None and time.monotonic() - seen <= self.timeout
+
+    def online_threads(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [tid for tid, seen in self._last_seen.items() if now - seen <= self.timeout]
+
+    def forget(self, thread_id: str):
+        """Drop a deleted thread without emitting a transition"""
+        with self._lock:
+            self._last_seen.pop(thread_id, None)
+            self._dirty.pop(thread_id, None)
+
+    def attach_bus(self, bus):
+        """Also drop deleted threads from the other workers' registries"""
+        self._bus = bus
+        bus.subscribe(self._on_remote_invalidation)
+
+    def _on_remote_invalidation(self, kind: str, key: str):
+        if kind == 'presence.forget':
+            self.forget(key)
+
+    def threads_deleted(self, thread_ids: List[str]):
+        """Database delete listener: deleted threads are no longer online or flushed"""
+        for thread_id in thread_ids:
+            self.forget(thread_id)
+            if self._bus is not None:
+                self._bus.publish_async('presence.forget', thread_id)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='presence', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.sweep()
+            self.flush()
+
+    def sweep(self):
+        """Expire visitors whose last heartbeat is older than the timeout"""
+        cutoff = time.monotonic() - self.timeout
+        with self._lock:
+            expired = [tid for tid, seen in self._last_seen.items() if seen < cutoff]
+            for thread_id in expired:
+                del self._last_seen[thread_id]
+        for thread_id in expired:
+            self._notify(thread_id, False)
+        return expired
+
+    def flush(self):
+        """Write pending last_activity_at values in one batch"""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+
+        rows = [(timestamp, thread_id) for thread_id, timestamp in sorted(dirty.items())]
+        try:
+            with self.db.get_connection() as conn:
+                try:
+                    cursor = conn.cursor()
+                    self.db.executemany(cursor, 'UPDATE threads SET last_activity_at = ? WHERE id = ?', rows)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        except Exception:
+            # Yazılamayan değerler bir sonraki flush'ta tekrar denenir (daha yenisi varsa o kalır)
+            with self._lock:
+                for thread_id, timestamp in dirty.items():
+                    self._dirty.setdefault(thread_id, timestamp)
+                self._stats['flush_errors'] += 1
+            return 0
+
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['rows_written'] += len(rows)
+        return len(rows)
+
+    def _notify(self, thread_id: str, online: bool):
+        with self._lock:
+            self._stats['transitions'] += 1
+        for callback in self._listeners:
+            try:
+                callback(thread_id, online)
+            except Exception:
+                with self._lock:
+                    self._stats['listener_errors'] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tracked_threads'] = len(self._last_seen)
+            stats['pending_writes'] = len(self._dirty)
+        stats['flush_interval_seconds'] = self.flush_interval
+        stats['timeout_seconds'] = self.timeout
+        return stats
+
+# Global presence registry
+presence = PresenceRegistry(db, Config.PRESENCE_FLUSH_SECONDS, Config.PRESENCE_TIMEOUT_SECONDS)
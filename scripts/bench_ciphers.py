@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# CIPHER BENCHMARK - Fernet vs AES-GCM vs ChaCha20-Poly1305 (throughput + stored size)
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from crypto import CryptoService, AEAD_CIPHERS
+
+CIPHERS = ['fernet'] + list(AEAD_CIPHERS)
+
+def bench(service, text, seconds):
+    """Süre dolana kadar encrypt+decrypt turu; saniyedeki tur sayısı"""
+    rounds = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            service.decrypt(service.encrypt(text))
+        rounds += 100
+    return rounds / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description='Message cipher microbenchmark')
+    parser.add_argument('--lengths', default='16,64,256,1024,4096', help='message lengths in characters')
+    parser.add_argument('--seconds', type=float, default=0.5, help='time per cipher and length')
+    args = parser.parse_args()
+
+    # DB'ye dokunmadan sabit salt ile servis kur; anahtar türetme bir kez
+    salt = os.urandom(16)
+    services = {name: CryptoService(None, 'benchmark-secret', cipher=name, salt=salt) for name in CIPHERS}
+
+    print(f"🔐 encrypt+decrypt round trips/s and stored bytes per message ({args.seconds}s each)")
+    print(f"{'length':>7}  " + '  '.join(f"{name:>26}" for name in CIPHERS))
+    for length in (int(value) for value in args.lengths.split(',')):
+        text = ('merhaba dünya ' * (length // 14 + 1))[:length]
+        cells = []
+        for name in CIPHERS:
+            service = services[name]
+            size = len(service.encrypt(text))
+            rate = bench(service, text, args.seconds)
+            cells.append(f"{rate:>12,.0f}/s {size:>6} B")
+        print(f"{length:>7}  " + '  '.join(f"{cell:>26}" for cell in cells))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# HUB LATENCY BENCHMARK - CPU-bound crypto/sanitize work inline vs through the blocking executor
+import sys
+import argparse
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Green hub stall while PBKDF2, page decrypt and bleach run')
+    parser.add_argument('--hub', choices=['eventlet', 'gevent'], default='eventlet')
+    parser.add_argument('--rounds', type=int, default=20, help='workload repetitions per mode')
+    parser.add_argument('--page', type=int, default=50, help='messages per decrypted page')
+    return parser.parse_args()
+
+args = parse_args()
+
+# Monkey patching her import'tan önce yapılmalı (gunicorn worker'ı da böyle başlar)
+if args.hub == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+    spawn = eventlet.spawn
+else:
+    import gevent.monkey
+    gevent.monkey.patch_all()
+    import gevent
+    spawn = gevent.spawn
+
+import os
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from crypto import CryptoService
+from offload import blocking_executor
+from security import security_manager
+
+TICK = 0.001
+
+def ticker(lags, running):
+    """1 ms'lik uykular; hedeften sapma = hub'ın başka işe bloklandığı süre"""
+    while running[0]:
+        started = time.perf_counter()
+        time.sleep(TICK)
+        lags.append((time.perf_counter() - started - TICK) * 1000)
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+def measure(workload, rounds):
+    """(iş süresi ms/tur, hub gecikmesi p50/p99/max ms)"""
+    lags, running = [], [True]
+    tick = spawn(ticker, lags, running)
+    time.sleep(0.01)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        workload()
+        time.sleep(0)
+    elapsed_ms = (time.perf_counter() - started) * 1000 / rounds
+    running[0] = False
+    tick.wait() if hasattr(tick, 'wait') else tick.join()
+    return elapsed_ms, percentile(lags, 0.5), percentile(lags, 0.99), max(lags)
+
+def main():
+    service = CryptoService(None, 'benchmark-secret', salt=os.urandom(16))
+    text = ('merhaba <b>dünya</b> & "tırnak" ' * 8)[:200]
+    page = [(service.encrypt(text), None) for _ in range(args.page)]
+    long_html = ('<p>uzun <strong>mesaj</strong> <a href="https://example.com" onclick="x()">link</a> '
+                 '<script>alert(1)</script></p>\n') * 100
+
+    def pbkdf2():
+        service._ring = None
+        service._key_ring()
+
+    workloads = [
+        ('PBKDF2 key ring', pbkdf2),
+        (f'decrypt page x{args.page}', lambda: service.decrypt_many(page)),
+        (f'bleach {len(long_html) // 1024} KiB', lambda: security_manager.sanitize_html(long_html)),
+    ]
+
+    detected = blocking_executor.mode
+    print(f"⏱️  {args.hub} hub, {args.rounds} rounds; executor mode {detected}, min {blocking_executor.min_bytes} B")
+    print(f"{'workload':22s} {'mode':9s} {'ms/round':>9s} {'lag p50':>9s} {'lag p99':>9s} {'lag max':>9s}")
+    for name, workload in workloads:
+        for mode in ('inline', detected):
+            blocking_executor._mode = mode
+            elapsed, p50, p99, worst = measure(workload, args.rounds)
+            print(f"{name:22s} {mode:9s} {elapsed:9.2f} {p50:9.2f} {p99:9.2f} {worst:9.2f}")
+    blocking_executor._mode = detected
+    return detected != 'inline'
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# MESSAGE MEMORY BENCHMARK - dict(row) vs MessageRecord in a full MessageCache
+import sys
+import uuid
+import argparse
+import tracemalloc
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from cache import MessageCache, compact_page, thread_messages_key
+
+def make_row(thread_id, i):
+    """DB'den gelen dict(row) ile aynı şekilde ayrı string nesneleri üret"""
+    return {
+        'id': str(uuid.uuid4()),
+        'thread_id': thread_id,
+        'sender': ''.join(['visi', 'tor']) if i % 2 else ''.join(['ad', 'min']),
+        'type': ''.join(['te', 'xt']),
+        'content_text': f'Message number {i} with some typical chat length text',
+        'file_path': None,
+        'created_at': f'2024-10-19 18:{i // 60 % 60:02d}:{i % 60:02d}',
+    }
+
+def fill_cache(threads, per_page, compact):
+    """Dolu bir cache'in tuttuğu bellek (satır üretimi dahil, tracemalloc ile)
+
+    Satırlar ölçüm içinde üretilir; compact modda kaynak dict'ler cache'e
+    girdikten sonra serbest kalır, yani yalnızca cache'te kalan ölçülür.
+    """
+    cache = MessageCache(max_size=threads + 1, ttl=3600)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(threads):
+        thread_id = str(uuid.uuid4())
+        page = {
+            'messages': [make_row(thread_id, i) for i in range(per_page)],
+            'has_more': True,
+            'next_cursor': 'x',
+            'total': per_page * 2,
+        }
+        cache.set(thread_messages_key(thread_id, per_page), compact_page(page) if compact else page,
+                  thread_id=thread_id)
+        del page
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return retained, cache
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-message memory of cached pages: dict rows vs MessageRecord')
+    parser.add_argument('--threads', type=int, default=500, help='cached pages (MessageCache default max_size)')
+    parser.add_argument('--per-page', type=int, default=50)
+    args = parser.parse_args()
+
+    total_messages = args.threads * args.per_page
+    print(f"📊 {args.threads} pages x {args.per_page} messages = {total_messages} cached messages")
+
+    results = {}
+    for label, compact in (('dict rows', False), ('MessageRecord', True)):
+        retained, cache = fill_cache(args.threads, args.per_page, compact)
+        results[label] = retained
+        stats = cache.get_stats()
+        print(f"  {label:14s} {retained / 1024 / 1024:8.2f} MiB  "
+              f"{retained / total_messages:7.1f} B/message  (estimate_size: {stats['bytes'] / 1024 / 1024:.2f} MiB)")
+        del cache
+
+    saved = results['dict rows'] - results['MessageRecord']
+    print(f"✅ Saved {saved / total_messages:.1f} B/message "
+          f"({saved / results['dict rows'] * 100:.1f}%, {saved / 1024 / 1024:.2f} MiB for a full cache)")
+
+if __name__ == '__main__':
+    main()
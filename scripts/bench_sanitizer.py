@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# SANITIZER BENCHMARK - messages/s of sanitize_html vs per-call escape + bleach.clean
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from security import security_manager
+from check_sanitizer import reference_sanitize
+
+# Tipik sohbet mesajları: çoğu düz metin, bir kısmı &, tırnak veya etiket içerir
+MESSAGES = {
+    'plain': ['Merhaba, siparişim ne zaman gelir?', 'Teşekkürler 🙏', 'tamam', 'Kargo takip numarası 123456789',
+              'Yarın saat 10:00 uygun mu?'],
+    'markup': ['Tom & Jerry', 'fiyat < 100 TL mi?', 'it\'s "ok"', '<b>acil</b> lütfen dönün',
+               '<script>alert(1)</script>'],
+}
+
+def bench(sanitize, messages, seconds):
+    """Süre dolana kadar mesaj listesini tekrar tekrar temizle; saniyedeki mesaj"""
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for message in messages:
+            sanitize(message)
+        count += len(messages)
+    return count / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description='sanitize_html throughput before and after the fast path')
+    parser.add_argument('--seconds', type=float, default=1.0, help='time per sanitizer and mix')
+    parser.add_argument('--plain-ratio', type=float, default=0.9, help='share of plain-text messages in the mix')
+    args = parser.parse_args()
+
+    plain_count = round(args.plain_ratio * 100)
+    mixes = {
+        'plain': MESSAGES['plain'],
+        'markup': MESSAGES['markup'],
+        f'mix {plain_count}% plain': (MESSAGES['plain'] * plain_count + MESSAGES['markup'] * (100 - plain_count)),
+    }
+
+    print(f"🧹 sanitize_html messages/s ({args.seconds}s each)")
+    print(f"{'messages':18s} {'before':>12s} {'after':>12s} {'speedup':>8s}")
+    for name, messages in mixes.items():
+        before = bench(reference_sanitize, messages, args.seconds)
+        after = bench(security_manager.sanitize_html, messages, args.seconds)
+        print(f"{name:18s} {before:>10,.0f}/s {after:>10,.0f}/s {after / before:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# REDIS CACHE CHECK - RedisMessageCache shared by two workers (fakeredis or a real Redis via --url)
+import sys
+import argparse
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+import redis
+from cache import RedisMessageCache, thread_messages_key
+
+THREAD_ID = 'check-thread'
+PER_PAGE = 3
+
+def make_page(count):
+    messages = [
+        {'id': f'm{i}', 'thread_id': THREAD_ID, 'sender': 'visitor', 'type': 'text',
+         'content_text': f'mesaj {i} ' + 'x' * 300, 'file_path': '', 'created_at': f'2026-01-01 00:00:0{i}'}
+        for i in range(count)
+    ]
+    return {'messages': messages, 'has_more': False, 'next_cursor': None, 'total': count}
+
+def main():
+    parser = argparse.ArgumentParser(description='Check RedisMessageCache across two clients of one server')
+    parser.add_argument('--url', help='real Redis URL (default: in-process fakeredis server)')
+    args = parser.parse_args()
+
+    if args.url:
+        make_client = lambda: redis.Redis.from_url(args.url)
+        # Önceki çalıştırmadan kalan anahtarlar
+        client = make_client()
+        for key in client.scan_iter('chat:check:*'):
+            client.delete(key)
+    elif fakeredis is not None:
+        server = fakeredis.FakeServer()
+        make_client = lambda: fakeredis.FakeRedis(server=server)
+    else:
+        print("❌ fakeredis is not installed and no --url given")
+        return False
+
+    # İki ayrı istemci = aynı Redis'i paylaşan iki worker
+    worker1 = RedisMessageCache(make_client(), ttl=60, prefix='chat:check:')
+    worker2 = RedisMessageCache(make_client(), ttl=60, prefix='chat:check:')
+    failures = []
+
+    def check(name, condition, detail=''):
+        print(f"{'✅' if condition else '❌'} {name}{f' ({detail})' if detail and not condition else ''}")
+        if not condition:
+            failures.append(name)
+
+    print(f"🧪 RedisMessageCache on {'Redis ' + args.url if args.url else 'fakeredis'}")
+
+    generation = worker1.thread_generation(THREAD_ID)
+    worker1.set_thread_messages(THREAD_ID, make_page(PER_PAGE), PER_PAGE, generation=generation)
+    page = worker2.get_thread_messages(THREAD_ID, PER_PAGE)
+    check('page set by worker 1 is read by worker 2', page is not None and page['total'] == PER_PAGE, page)
+
+    ttl = make_client().ttl('chat:check:' + thread_messages_key(THREAD_ID, PER_PAGE))
+    check('page is stored with the cache TTL', 0 < ttl <= 60, ttl)
+
+    worker2.append_thread_message(THREAD_ID, {
+        'id': 'm9', 'thread_id': THREAD_ID, 'sender': 'admin', 'type': 'text',
+        'content_text': 'yeni', 'file_path': '', 'created_at': '2026-01-01 00:00:09'
+    })
+    page = worker1.get_thread_messages(THREAD_ID, PER_PAGE)
+    ids = [message['id'] for message in page['messages']] if page else None
+    check('append by worker 2 is seen by worker 1', ids == ['m1', 'm2', 'm9'], ids)
+    check('append keeps has_more and total current', page is not None and page['has_more'] and page['total'] == PER_PAGE + 1,
+          page and (page['has_more'], page['total']))
+
+    # Yükleme sırasında başka bir worker invalidate ederse eski sayfa yazılmamalı
+    generation = worker1.thread_generation(THREAD_ID)
+    worker2.invalidate_thread(THREAD_ID)
+    check('invalidation by worker 2 drops the page for worker 1', worker1.get_thread_messages(THREAD_ID, PER_PAGE) is None)
+    worker1.set_thread_messages(THREAD_ID, make_page(PER_PAGE), PER_PAGE, generation=generation)
+    check('stale set after a concurrent invalidation is skipped',
+          worker2.get_thread_messages(THREAD_ID, PER_PAGE) is None and worker1.get_stats()['stale_sets_skipped'] == 1,
+          worker1.get_stats()['stale_sets_skipped'])
+
+    # Redis'e ulaşılamazsa hata sayılır ve miss döner
+    broken = RedisMessageCache(redis.Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.2), prefix='chat:check:')
+    value = broken.get_thread_messages(THREAD_ID, PER_PAGE)
+    check('unreachable server is a counted miss', value is None and broken.get_stats()['errors'] >= 1,
+          broken.get_stats()['errors'])
+
+    if failures:
+        print(f"❌ {len(failures)} checks failed")
+        return False
+    print("✅ all checks passed")
+    return True
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# SANITIZER CHECK - sanitize_html output pinned by golden cases and the escape + bleach.clean reference
+import sys
+import html
+import random
+import argparse
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+import bleach
+from security import security_manager
+
+# (girdi, beklenen çıktı): escape + bleach.clean'in bugünkü davranışı
+GOLDEN_CASES = [
+    ('', ''),
+    ('merhaba', 'merhaba'),
+    ('Merhaba dünya, nasılsın?', 'Merhaba dünya, nasılsın?'),
+    ('emoji 😀 ve ünicode ğüşıöç', 'emoji 😀 ve ünicode ğüşıöç'),
+    ('a\tb\nc', 'a\tb\nc'),
+    ('   ', '   '),
+    ('https://example.com/path?x=1', 'https://example.com/path?x=1'),
+    ('<b>kalın</b>', '&lt;b&gt;kalın&lt;/b&gt;'),
+    ('<p>paragraf</p>', '&lt;p&gt;paragraf&lt;/p&gt;'),
+    ('<script>alert("xss")</script>', '&lt;script&gt;alert(&quot;xss&quot;)&lt;/script&gt;'),
+    ('<img src=x onerror=alert(1)>', '&lt;img src=x onerror=alert(1)&gt;'),
+    ('<a href="javascript:alert(1)">x</a>', '&lt;a href=&quot;javascript:alert(1)&quot;&gt;x&lt;/a&gt;'),
+    ('<!-- yorum -->', '&lt;!-- yorum --&gt;'),
+    ('Tom & Jerry', 'Tom &amp; Jerry'),
+    ('5 > 3 < 4', '5 &gt; 3 &lt; 4'),
+    ('it\'s "quoted"', 'it&#x27;s &quot;quoted&quot;'),
+    ('&amp; already escaped', '&amp;amp; already escaped'),
+    ('&lt;b&gt;', '&amp;lt;b&amp;gt;'),
+    ('&#60;script&#62;', '&amp;#60;script&amp;#62;'),
+    # html5lib kontrol karakterlerini normalize eder; bu metinler hızlı yoldan geçmez
+    ('satır\r\nsonu', 'satır\nsonu'),
+    ('satır\rsonu', 'satır\nsonu'),
+    ('form\x0cfeed', 'form?feed'),
+    ('null\x00byte', 'nullbyte'),
+    ('bell\x07', 'bell?'),
+    ('del\x7fchar', 'del\x7fchar'),
+    ('\u2028ayraç', '\u2028ayraç'),
+]
+
+def reference_sanitize(content):
+    """Eski sanitize_html: her çağrıda escape + yeni config ile bleach.clean"""
+    if not content:
+        return content
+    return bleach.clean(
+        html.escape(content, quote=True),
+        tags=security_manager.allowed_tags,
+        attributes=security_manager.allowed_attributes,
+        strip=True
+    )
+
+def random_text(rng, alphabet):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 40)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Check sanitize_html against golden cases and the reference')
+    parser.add_argument('--fuzz', type=int, default=20000, help='random strings compared with the reference')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"🧪 {len(GOLDEN_CASES)} golden cases")
+    for content, expected in GOLDEN_CASES:
+        actual = security_manager.sanitize_html(content)
+        reference = reference_sanitize(content)
+        if actual != expected or reference != expected:
+            failures += 1
+            print(f"❌ {content!r}: got {actual!r}, reference {reference!r}, expected {expected!r}")
+
+    # Düz metin ağırlıklı alfabe + HTML özel karakterleri + kontrol karakterleri
+    rng = random.Random(args.seed)
+    alphabet = [chr(cp) for cp in range(0x20, 0x250)] + list('<>&"\'\t\n\r\x00\x07\x0c\x7f') + \
+        [' ', '﻿', '�', '😀', 'ş', 'ğ', 'ı'] + list('abc ') * 20
+    for _ in range(args.fuzz):
+        content = random_text(rng, alphabet)
+        actual = security_manager.sanitize_html(content)
+        reference = reference_sanitize(content)
+        if actual != reference:
+            failures += 1
+            if failures <= 20:
+                print(f"❌ {content!r}: got {actual!r}, reference {reference!r}")
+
+    if failures:
+        print(f"❌ {failures} mismatches")
+        return False
+    print(f"✅ golden cases and {args.fuzz} random strings match the reference")
+    return True
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# CONVERT CIPHERTEXT - Çift base64'lü eski mesajları tek kodlu Fernet token'a çevirir
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from database import db
+from crypto import crypto
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """Convert legacy rows in batches; safe to run while the app is serving"""
+    parser = argparse.ArgumentParser(description='Convert double-base64 message ciphertext to single-encoded tokens')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep between batches')
+    args = parser.parse_args()
+
+    print("🔐 CIPHERTEXT DÖNÜŞÜMÜ BAŞLADI...")
+    print(f"📍 Database: {'PostgreSQL' if db.is_postgres else 'SQLite'}")
+
+    def report(progress):
+        print(f"   ↳ {progress['scanned']} satır tarandı, {progress['converted']} dönüştürüldü")
+
+    try:
+        result = crypto.convert_legacy_messages(args.batch_size, args.pause, progress=report)
+    except Exception as e:
+        print(f"❌ Dönüşüm hatası: {e}")
+        return False
+
+    print(f"✅ {result['converted']} mesaj dönüştürüldü, {result['bytes_saved'] / 1024:.1f} KiB kazanıldı")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# MIGRATE - Bekleyen şema migration'larını uygular (deploy adımı)
+import sys
+import logging
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from database import db
+from migrations import run_migrations, discover_migrations, applied_versions
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """Apply pending migrations and print schema status"""
+    print("🗄️ MIGRATION BAŞLADI...")
+    print(f"📍 Database: {'PostgreSQL' if db.is_postgres else 'SQLite'}")
+
+    try:
+        applied = run_migrations(db)
+    except Exception as e:
+        print(f"❌ Migration hatası: {e}")
+        return False
+
+    if applied:
+        for name in applied:
+            print(f"✅ Uygulandı: {name}")
+    else:
+        print("✅ Şema güncel, bekleyen migration yok")
+
+    done = applied_versions(db)
+    for version, name, _ in discover_migrations():
+        status = '✅' if version in done else '❌'
+        print(f"   {status} {version:04d}_{name}")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -1,9 +1,17 @@
-import bleach
 import html
+import threading
+from bleach.sanitizer import Cleaner
 from flask import request
 from werkzeug.utils import secure_filename
 import re
 
+from offload import blocking_executor
+
+# Bu karakterlerden hiçbirini içermeyen metni escape + bleach değiştirmez:
+# HTML özel karakterleri ve html5lib'in '?'/'\n'e çevirdiği C0 kontrol karakterleri
+# (\t ve \n hariç). İçermeyen metin parse edilmeden olduğu gibi döner.
+MARKUP_OR_CONTROL = re.compile('[<>&"\'\x00-\x08\x0b-\x1f]')
+
 class SecurityManager:
     """Centralized security management for the chat application"""
 
@@ -17,24 +25,33 @@ class SecurityManager:
             'a': ['href', 'title'],
             'img': ['src', 'alt', 'title']
         }
+        # Cleaner thread-safe değil (parser state tutar): thread başına bir kez kurulur
+        self._local = threading.local()
+
+    def _cleaner(self) -> Cleaner:
+        cleaner = getattr(self._local, 'cleaner', None)
+        if cleaner is None:
+            cleaner = Cleaner(tags=self.allowed_tags, attributes=self.allowed_attributes, strip=True)
+            self._local.cleaner = cleaner
+        return cleaner
+
+    def _clean(self, content: str) -> str:
+        return self._cleaner().clean(content)
 
     def sanitize_html(self, content: str) -> str:
-        """Sanitize HTML content to prevent XSS attacks"""
-        if not content:
+        """Sanitize HTML content to prevent XSS attacks
+
+        Çıktı html.escape + bleach.clean ile birebir aynıdır
+        (scripts/check_sanitizer.py golden case'leri); düz metin parse edilmez.
+        """
+        if not content or not MARKUP_OR_CONTROL.search(content):
             return content
 
         # First, escape HTML entities
         content = html.escape(content, quote=True)
 
-        # Then allow specific tags
-        content = bleach.clean(
-            content,
-            tags=self.allowed_tags,
-            attributes=self.allowed_attributes,
-            strip=True
-        )
-
-        return content
+        # Then allow specific tags (uzun metinlerde bleach hub dışında çalışır)
+        return blocking_executor.run(self._clean, content, size=len(content))
 
     def validate_input(self, data: dict) -> dict:
         """Validate and sanitize input data"""
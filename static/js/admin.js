@@ -43,7 +43,16 @@ let isRecording = false;
 let mediaRecorder = null;
 let audioChunks = [];
 let onlineThreads = new Set();
-let onlineTimeouts = new Map();
+let olderCursor = null;
+let hasOlderMessages = false;
+let loadingOlder = false;
+
+// Delta-sync durumu: sunucudan yalnızca son versiyondan sonra değişen thread'ler çekilir
+const threadsById = new Map();
+const threadElements = new Map();
+let threadsVersion = 0;
+let threadsSyncing = false;
+let threadsSyncQueued = false;
 
 // Socket connection logging
 socket.on('connect', () => {
@@ -86,7 +95,7 @@ backBtn.addEventListener('click', () => {
     chatPanel.classList.remove('fullscreen');
     threadListEl.classList.remove('hidden');
     
-    loadThreads();
+    renderThreads();
 });
 
 const threadsDiv = document.getElementById('threads');
@@ -107,31 +116,61 @@ loadThreads();
 
 // Auto-refresh thread times every 30 seconds
 setInterval(() => {
+    threadElements.forEach(div => div.remove());
+    threadElements.clear();
     loadThreads();
 }, 30000);
 
 // Socket events
 socket.on('message_from_visitor', (data) => {
-    setThreadOnline(data.thread_id);
+    if (setThreadOnline(data.thread_id, true)) {
+        refreshThread(data.thread_id);
+    }
     if (data.thread_id === currentThreadId) {
         addMessage(data, 'visitor');
     }
-    loadThreads();
     playNotification();
 });
 
+// Sunucunun gönderdiği thread özeti patch'i: liste HTTP isteği olmadan yerinde güncellenir
+socket.on('thread_updated', (patch) => {
+    const thread = threadsById.get(patch.id);
+    if (!thread) {
+        // Listede olmayan (yeni) thread: delta-sync ile çek
+        loadThreads();
+        return;
+    }
+    if (thread.version && patch.version < thread.version) return;
+    
+    const {online, ...fields} = patch;
+    Object.assign(thread, fields);
+    setThreadOnline(patch.id, online);
+    // Açık olan konuşmaya gelen mesajlar okunmuş sayılır
+    if (patch.id === currentThreadId && patch.unread_count > 0) {
+        socket.emit('mark_thread_read', {thread_id: patch.id});
+    }
+    refreshThread(patch.id);
+});
+
 
 
+// Presence yalnızca geçişlerde gelir (sunucu heartbeat'leri bellekte toplar)
 socket.on('visitor_online', (data) => {
-    setThreadOnline(data.thread_id);
-    loadThreads();
+    if (setThreadOnline(data.thread_id, true)) {
+        refreshThread(data.thread_id);
+    }
+});
+
+socket.on('visitor_offline', (data) => {
+    if (setThreadOnline(data.thread_id, false)) {
+        refreshThread(data.thread_id);
+    }
 });
 
 socket.on('message_from_telegram', (data) => {
     if (data.thread_id === currentThreadId) {
         addMessage(data, 'admin');
     }
-    loadThreads();
 });
 
 // New message notification
@@ -142,186 +181,265 @@ socket.on('new_message_notification', (data) => {
     }
 });
 
-// Helper function to manage online status
-function setThreadOnline(threadId) {
-    // Clear existing timeout
-    if (onlineTimeouts.has(threadId)) {
-        clearTimeout(onlineTimeouts.get(threadId));
-    }
-    
-    // Set online
-    onlineThreads.add(threadId);
-    
-    // Set new timeout to remove after 2 minutes
-    const timeout = setTimeout(() => {
+// Helper function to manage online status; durum değiştiyse true döner
+function setThreadOnline(threadId, online) {
+    if (onlineThreads.has(threadId) === online) return false;
+    if (online) {
+        onlineThreads.add(threadId);
+    } else {
         onlineThreads.delete(threadId);
-        onlineTimeouts.delete(threadId);
-        loadThreads();
-    }, 2 * 60 * 1000);
-    
-    onlineTimeouts.set(threadId, timeout);
+    }
+    return true;
 }
 
 // Load threads
 async function loadThreads() {
-    const res = await fetch('/api/threads');
-    const threads = await res.json();
-    
-    threadsDiv.innerHTML = '';
-    threads.forEach(thread => {
-        const div = document.createElement('div');
-        div.className = 'thread-item';
-        if (thread.id === currentThreadId) {
-            div.classList.add('active');
+    // Sync sürerken gelen çağrılar bir sonraki tura birleşir
+    if (threadsSyncing) {
+        threadsSyncQueued = true;
+        return;
+    }
+    threadsSyncing = true;
+    try {
+        do {
+            threadsSyncQueued = false;
+            await syncThreads();
+        } while (threadsSyncQueued);
+    } catch (e) {
+        console.error('Thread sync error:', e);
+    } finally {
+        threadsSyncing = false;
+    }
+}
+
+async function syncThreads() {
+    const res = await fetch(`/api/threads?since=${threadsVersion}`);
+    if (!res.ok) return;
+    const delta = await res.json();
+    
+    if (delta.full) {
+        threadsById.clear();
+        threadElements.clear();
+        threadsDiv.innerHTML = '';
+    }
+    delta.deleted.forEach(threadId => {
+        threadsById.delete(threadId);
+        invalidateThreadElement(threadId);
+    });
+    delta.threads.forEach(thread => {
+        threadsById.set(thread.id, thread);
+        invalidateThreadElement(thread.id);
+    });
+    // Sunucudaki presence durumu (yeniden bağlanınca kaçan geçişler için)
+    const online = new Set(delta.online || []);
+    threadsById.forEach((thread, threadId) => {
+        if (setThreadOnline(threadId, online.has(threadId))) {
+            invalidateThreadElement(threadId);
         }
-        
-        // Check if online
-        const isOnline = onlineThreads.has(thread.id);
-        
-        // Format time
-        let dateText = '';
-        let timeText = '';
-        let agoText = '';
-        let dateClass = 'online-text';
-        
-        if (isOnline) {
-            dateText = 'Çevrimiçi';
-        } else {
-            const lastTime = thread.last_message_time || thread.last_activity_at;
-            if (lastTime) {
-                try {
-                    // Parse date - SQLite format: YYYY-MM-DD HH:MM:SS (already in Turkey time UTC+3)
-                    let msgDate;
-                    if (lastTime.includes('T')) {
-                        msgDate = new Date(lastTime);
-                    } else {
-                        // SQLite format - already in Turkey time
-                        msgDate = new Date(lastTime.replace(' ', 'T'));
-                    }
-                    
-                    // Format: DD.MM.YYYY
-                    dateText = msgDate.toLocaleDateString('tr-TR', { 
-                        day: '2-digit', 
-                        month: '2-digit', 
-                        year: 'numeric' 
-                    });
-                    
-                    // Format: HH:MM
-                    timeText = msgDate.toLocaleTimeString('tr-TR', { 
-                        hour: '2-digit', 
-                        minute: '2-digit' 
-                    });
-                    
-                    // Calculate "ago" text and time class
-                    const now = new Date();
-                    const diffMs = now - msgDate;
-                    const diffMins = Math.floor(diffMs / 60000);
-                    const diffHours = Math.floor(diffMs / 3600000);
-                    const diffDays = Math.floor(diffMs / 86400000);
-                    
-                    let timeClass = '';
-                    if (diffMins < 1) {
-                        agoText = 'Şimdi';
-                        timeClass = 'time-now';
-                    } else if (diffMins < 60) {
-                        agoText = diffMins + 'dk önce';
-                        timeClass = 'time-minutes';
-                    } else if (diffHours < 24) {
-                        agoText = diffHours + 'sa önce';
-                        timeClass = 'time-hours';
-                    } else if (diffDays === 1) {
-                        agoText = 'Dün';
-                        timeClass = 'time-yesterday';
-                    } else if (diffDays < 7) {
-                        agoText = diffDays + 'g önce';
-                        timeClass = 'time-days';
-                    } else {
-                        agoText = msgDate.toLocaleDateString('tr-TR', { day: 'numeric', month: 'short' });
-                        timeClass = 'time-old';
-                    }
-                    div.setAttribute('data-time-class', timeClass);
-                } catch (e) {
-                    console.log('Date parse error:', e, lastTime);
-                    dateText = '';
-                    timeText = '';
-                    agoText = '';
-                }
-            }
+    });
+    threadsVersion = delta.version;
+    renderThreads();
+}
+
+function invalidateThreadElement(threadId) {
+    const div = threadElements.get(threadId);
+    if (div) {
+        div.remove();
+        threadElements.delete(threadId);
+    }
+}
+
+// Tek thread'i yeniden çiz (online durumu değişince)
+function refreshThread(threadId) {
+    invalidateThreadElement(threadId);
+    renderThreads();
+}
+
+// Listeyi bellekteki durumdan çiz; yalnızca değişen öğeler yeniden oluşturulur
+function renderThreads() {
+    const threads = Array.from(threadsById.values()).sort(compareThreads);
+    threads.forEach((thread, index) => {
+        let div = threadElements.get(thread.id);
+        if (!div) {
+            div = createThreadElement(thread);
+            threadElements.set(thread.id, div);
         }
-        
-        const timeClass = div.getAttribute('data-time-class') || '';
-        
-        // Renk ataması: Şimdi ve dakikalar için time, saatler için date
-        let timeClass2 = '';
-        if (!isOnline) {
-            dateClass = '';
-            if (timeClass === 'time-now') {
-                timeClass2 = 'time-now'; // Yeşil
-            } else if (timeClass === 'time-minutes') {
-                timeClass2 = 'time-minutes'; // Mavi
-            } else if (timeClass === 'time-hours') {
-                dateClass = 'time-hours'; // Kırmızı
-            }
+        div.classList.toggle('active', thread.id === currentThreadId);
+        const current = threadsDiv.children[index];
+        if (current !== div) {
+            threadsDiv.insertBefore(div, current || null);
         }
-        
-        // Create elements safely to prevent XSS
-        const statusDot = document.createElement('div');
-        statusDot.className = `status-dot ${isOnline ? 'online' : 'offline'}`;
-        
-        const threadContent = document.createElement('div');
-        threadContent.className = 'thread-content';
-        
-        const threadRow1 = document.createElement('div');
-        threadRow1.className = 'thread-row';
-        
-        const threadName = document.createElement('div');
-        threadName.className = 'thread-name';
-        threadName.textContent = thread.display_name; // Safe text content
-        
-        const threadRow2 = document.createElement('div');
-        threadRow2.className = 'thread-row';
-        
-        const threadPreview = document.createElement('div');
-        threadPreview.className = 'thread-preview';
-        threadPreview.textContent = thread.last_message || 'Mesaj yok'; // Safe text content
-        
-        const dateTimeDiv = document.createElement('div');
-        dateTimeDiv.className = 'thread-date-time';
-        
-        const dateSpan = document.createElement('span');
-        dateSpan.className = `thread-date ${dateClass}`;
-        dateSpan.textContent = dateText; // Safe text content
-        
-        // Assemble the structure
-        threadRow1.appendChild(threadName);
-        if (agoText) {
-            const agoDiv = document.createElement('div');
-            agoDiv.className = `thread-ago ${timeClass}`;
-            agoDiv.textContent = agoText; // Safe text content
-            threadRow1.appendChild(agoDiv);
+    });
+}
+
+function parseThreadTime(value) {
+    // SQLite format: YYYY-MM-DD HH:MM:SS (already in Turkey time UTC+3)
+    if (value.includes('T')) {
+        return new Date(value);
+    }
+    return new Date(value.replace(' ', 'T'));
+}
+
+// Sunucudaki sıralamayla aynı: last_message_at DESC, mesajsız thread'ler sonda
+function compareThreads(a, b) {
+    const aTime = a.last_message_at ? parseThreadTime(a.last_message_at).getTime() : -Infinity;
+    const bTime = b.last_message_at ? parseThreadTime(b.last_message_at).getTime() : -Infinity;
+    if (aTime !== bTime) {
+        return bTime > aTime ? 1 : -1;
+    }
+    return a.id < b.id ? -1 : 1;
+}
+
+function createThreadElement(thread) {
+    const div = document.createElement('div');
+    div.className = 'thread-item';
+    
+    // Check if online
+    const isOnline = onlineThreads.has(thread.id);
+    
+    // Format time
+    let dateText = '';
+    let timeText = '';
+    let agoText = '';
+    let dateClass = 'online-text';
+    
+    if (isOnline) {
+        dateText = 'Çevrimiçi';
+    } else {
+        const lastTime = thread.last_message_at || thread.last_activity_at;
+        if (lastTime) {
+            try {
+                const msgDate = parseThreadTime(lastTime);
+                
+                // Format: DD.MM.YYYY
+                dateText = msgDate.toLocaleDateString('tr-TR', { 
+                    day: '2-digit', 
+                    month: '2-digit', 
+                    year: 'numeric' 
+                });
+                
+                // Format: HH:MM
+                timeText = msgDate.toLocaleTimeString('tr-TR', { 
+                    hour: '2-digit', 
+                    minute: '2-digit' 
+                });
+                
+                // Calculate "ago" text and time class
+                const now = new Date();
+                const diffMs = now - msgDate;
+                const diffMins = Math.floor(diffMs / 60000);
+                const diffHours = Math.floor(diffMs / 3600000);
+                const diffDays = Math.floor(diffMs / 86400000);
+                
+                let timeClass = '';
+                if (diffMins < 1) {
+                    agoText = 'Şimdi';
+                    timeClass = 'time-now';
+                } else if (diffMins < 60) {
+                    agoText = diffMins + 'dk önce';
+                    timeClass = 'time-minutes';
+                } else if (diffHours < 24) {
+                    agoText = diffHours + 'sa önce';
+                    timeClass = 'time-hours';
+                } else if (diffDays === 1) {
+                    agoText = 'Dün';
+                    timeClass = 'time-yesterday';
+                } else if (diffDays < 7) {
+                    agoText = diffDays + 'g önce';
+                    timeClass = 'time-days';
+                } else {
+                    agoText = msgDate.toLocaleDateString('tr-TR', { day: 'numeric', month: 'short' });
+                    timeClass = 'time-old';
+                }
+                div.setAttribute('data-time-class', timeClass);
+            } catch (e) {
+                console.log('Date parse error:', e, lastTime);
+                dateText = '';
+                timeText = '';
+                agoText = '';
+            }
         }
-        
-        threadRow2.appendChild(threadPreview);
-        
-        dateTimeDiv.appendChild(dateSpan);
-        if (timeText) {
-            const timeSpan = document.createElement('span');
-            timeSpan.className = `thread-time ${timeClass2}`;
-            timeSpan.textContent = timeText; // Safe text content
-            dateTimeDiv.appendChild(timeSpan);
+    }
+    
+    const timeClass = div.getAttribute('data-time-class') || '';
+    
+    // Renk ataması: Şimdi ve dakikalar için time, saatler için date
+    let timeClass2 = '';
+    if (!isOnline) {
+        dateClass = '';
+        if (timeClass === 'time-now') {
+            timeClass2 = 'time-now'; // Yeşil
+        } else if (timeClass === 'time-minutes') {
+            timeClass2 = 'time-minutes'; // Mavi
+        } else if (timeClass === 'time-hours') {
+            dateClass = 'time-hours'; // Kırmızı
         }
-        
-        threadRow2.appendChild(dateTimeDiv);
-        
-        threadContent.appendChild(threadRow1);
-        threadContent.appendChild(threadRow2);
-        
-        div.appendChild(statusDot);
-        div.appendChild(threadContent);
-        
-        div.addEventListener('click', () => selectThread(thread.id, thread.display_name));
-        threadsDiv.appendChild(div);
-    });
+    }
+    
+    // Create elements safely to prevent XSS
+    const statusDot = document.createElement('div');
+    statusDot.className = `status-dot ${isOnline ? 'online' : 'offline'}`;
+    
+    const threadContent = document.createElement('div');
+    threadContent.className = 'thread-content';
+    
+    const threadRow1 = document.createElement('div');
+    threadRow1.className = 'thread-row';
+    
+    const threadName = document.createElement('div');
+    threadName.className = 'thread-name';
+    threadName.textContent = thread.display_name; // Safe text content
+    
+    const threadRow2 = document.createElement('div');
+    threadRow2.className = 'thread-row';
+    
+    const threadPreview = document.createElement('div');
+    threadPreview.className = 'thread-preview';
+    threadPreview.textContent = thread.last_message_preview || 'Mesaj yok'; // Safe text content
+    
+    const dateTimeDiv = document.createElement('div');
+    dateTimeDiv.className = 'thread-date-time';
+    
+    const dateSpan = document.createElement('span');
+    dateSpan.className = `thread-date ${dateClass}`;
+    dateSpan.textContent = dateText; // Safe text content
+    
+    // Assemble the structure
+    threadRow1.appendChild(threadName);
+    if (agoText) {
+        const agoDiv = document.createElement('div');
+        agoDiv.className = `thread-ago ${timeClass}`;
+        agoDiv.textContent = agoText; // Safe text content
+        threadRow1.appendChild(agoDiv);
+    }
+    
+    threadRow2.appendChild(threadPreview);
+    
+    if (thread.unread_count > 0) {
+        const unreadBadge = document.createElement('span');
+        unreadBadge.className = 'thread-unread';
+        unreadBadge.textContent = thread.unread_count > 99 ? '99+' : String(thread.unread_count);
+        threadRow2.appendChild(unreadBadge);
+    }
+    
+    dateTimeDiv.appendChild(dateSpan);
+    if (timeText) {
+        const timeSpan = document.createElement('span');
+        timeSpan.className = `thread-time ${timeClass2}`;
+        timeSpan.textContent = timeText; // Safe text content
+        dateTimeDiv.appendChild(timeSpan);
+    }
+    
+    threadRow2.appendChild(dateTimeDiv);
+    
+    threadContent.appendChild(threadRow1);
+    threadContent.appendChild(threadRow2);
+    
+    div.appendChild(statusDot);
+    div.appendChild(threadContent);
+    
+    div.addEventListener('click', () => selectThread(thread.id, thread.display_name));
+    return div;
 }
 
 // Select thread
@@ -335,18 +453,57 @@ async function selectThread(threadId, name) {
     chatPanel.classList.add('fullscreen');
     threadListEl.classList.add('hidden');
     
-    const res = await fetch(`/api/messages?thread_id=${threadId}`);
-    const messages = await res.json();
+    const res = await fetch(`/api/messages?thread_id=${encodeURIComponent(threadId)}`);
+    const body = await res.json();
+    const page = body.data || {messages: [], pagination: {}};
     
     messagesDiv.innerHTML = '';
-    messages.forEach(msg => {
+    page.messages.forEach(msg => {
         const senderClass = msg.sender === 'visitor' ? 'visitor' : 'admin';
         addMessage(msg, senderClass);
     });
+    olderCursor = page.pagination.next_cursor;
+    hasOlderMessages = !!page.pagination.has_more;
     
-    loadThreads();
+    const thread = threadsById.get(threadId);
+    if (thread && thread.unread_count > 0) {
+        socket.emit('mark_thread_read', {thread_id: threadId});
+    }
+    renderThreads();
 }
 
+// Yukarı kaydırınca eski mesajları cursor ile yükle
+async function loadOlderMessages() {
+    if (!currentThreadId || !hasOlderMessages || loadingOlder || !olderCursor) return;
+    loadingOlder = true;
+    const threadId = currentThreadId;
+    try {
+        const res = await fetch(`/api/messages?thread_id=${encodeURIComponent(threadId)}&before=${encodeURIComponent(olderCursor)}`);
+        const body = await res.json();
+        if (threadId !== currentThreadId || !body.data) return;
+        
+        const previousHeight = messagesDiv.scrollHeight;
+        const firstChild = messagesDiv.firstChild;
+        body.data.messages.forEach(msg => {
+            const senderClass = msg.sender === 'visitor' ? 'visitor' : 'admin';
+            messagesDiv.insertBefore(createMessageElement(msg, senderClass), firstChild);
+        });
+        // Kaydırma konumunu koru
+        messagesDiv.scrollTop = messagesDiv.scrollHeight - previousHeight;
+        
+        olderCursor = body.data.pagination.next_cursor;
+        hasOlderMessages = !!body.data.pagination.has_more;
+    } finally {
+        loadingOlder = false;
+    }
+}
+
+messagesDiv.addEventListener('scroll', () => {
+    if (messagesDiv.scrollTop === 0) {
+        loadOlderMessages();
+    }
+});
+
 // Send message
 sendBtn.addEventListener('click', sendMessage);
 msgInput.addEventListener('keypress', (e) => {
@@ -455,6 +612,12 @@ async function toggleRecording() {
 
 // Add message to UI
 function addMessage(data, senderClass) {
+    // Use global messagesDiv that targets '#admin-messages'
+    messagesDiv.appendChild(createMessageElement(data, senderClass));
+    messagesDiv.scrollTop = messagesDiv.scrollHeight;
+}
+
+function createMessageElement(data, senderClass) {
     const msgDiv = document.createElement('div');
     msgDiv.className = `message ${senderClass || (data.sender === 'visitor' ? 'visitor' : 'admin')}`;
 
@@ -490,9 +653,7 @@ function addMessage(data, senderClass) {
 
     bubble.appendChild(time);
     msgDiv.appendChild(bubble);
-    // Use global messagesDiv that targets '#admin-messages'
-    messagesDiv.appendChild(msgDiv);
-    messagesDiv.scrollTop = messagesDiv.scrollHeight;
+    return msgDiv;
 }
 
 // Custom confirm modal
@@ -635,7 +796,6 @@ function showMessageNotification(data) {
     });
 
     // Close button
-    const closeBtn = notification.querySelector('.notification-close');
     closeBtn.addEventListener('click', () => {
         clearTimeout(hideTimeout);
         hideNotification(notification);